@@ -0,0 +1,122 @@
+'''
+    Measure the build latency of ``build_module``: a cold build, a build served by the shared cache,
+    the up to date check, the registry lookup and the rebuild after one of the sources changed.
+
+    usage: python benchmarks/build_time.py [--files 8] [--repeat 5]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cfly  # noqa: E402
+
+chunk = '''\
+#include <Python.h>
+
+struct Item%(i)d {
+    PyObject_HEAD
+    long value;
+};
+
+PyObject * Item%(i)d_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+    return type->tp_alloc(type, 0);
+}
+
+long Item%(i)d_meth_value(Item%(i)d * self) {
+    return self->value + %(version)d;
+}
+
+PyObject * meth_part%(i)d(PyObject * self) {
+    return PyLong_FromLong(%(i)d);
+}
+'''
+
+
+def write_sources(folder, files, version=0, changed=None):
+    filenames = []
+    for i in range(files):
+        filename = os.path.join(folder, 'part%d.cpp' % i)
+        if changed is None or changed == i:
+            with open(filename, 'w') as f:
+                f.write(chunk % {'i': i, 'version': version})
+        filenames.append(filename)
+    return filenames
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def summary(timings):
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def build_time(files=8, repeat=5):
+    folder = tempfile.mkdtemp()
+    previous = os.environ.get('CFLY_CACHE_DIR')
+    os.environ['CFLY_CACHE_DIR'] = os.path.join(folder, 'cache')
+
+    try:
+        preprocess = write_sources(folder, files)
+        timings = {'cold': [], 'shared_cache': [], 'up_to_date': [], 'registry': [], 'incremental': []}
+
+        for index in range(repeat):
+            name = 'bench_build_%d' % index
+            output_dir = os.path.join(folder, 'out%d' % index)
+            kwargs = {'preprocess': preprocess, 'output_dir': output_dir}
+            os.makedirs(output_dir)
+
+            # every round starts from an empty shared cache
+            shutil.rmtree(os.environ['CFLY_CACHE_DIR'], ignore_errors=True)
+            build_dir = os.path.join(folder, 'cold%d' % index)
+            timings['cold'].append(timed(lambda: cfly.build_module(name, build_dir=build_dir, **kwargs)))
+
+            cfly.invalidate()
+            build_dir = os.path.join(folder, 'warm%d' % index)
+            timings['shared_cache'].append(timed(lambda: cfly.build_module(name, build_dir=build_dir, **kwargs)))
+
+            cfly.invalidate()
+            timings['up_to_date'].append(timed(lambda: cfly.build_module(name, build_dir=build_dir, **kwargs)))
+            timings['registry'].append(timed(lambda: cfly.build_module(name, build_dir=build_dir, **kwargs)))
+
+            # a new version of one file, the other objects are reused
+            write_sources(folder, files, version=index + 1, changed=0)
+            cfly.invalidate()
+            timings['incremental'].append(timed(lambda: cfly.build_module(name, build_dir=build_dir, **kwargs)))
+            write_sources(folder, files, changed=0)
+
+        return [
+            {'name': 'build_time', 'case': case, 'files': files, 'repeat': repeat, **summary(values)}
+            for case, values in timings.items()
+        ]
+
+    finally:
+        if previous is None:
+            del os.environ['CFLY_CACHE_DIR']
+        else:
+            os.environ['CFLY_CACHE_DIR'] = previous
+
+        cfly.invalidate()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(build_time(args.files, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
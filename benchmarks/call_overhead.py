@@ -0,0 +1,132 @@
+'''
+    Measure the cost of a call through the generated method tables and type slots, the functions do no work.
+
+    usage: python benchmarks/call_overhead.py [--number 1000000] [--repeat 5]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cfly  # noqa: E402
+
+source = '''\
+#include <Python.h>
+
+struct Point {
+    PyObject_HEAD
+    long x;
+};
+
+PyObject * Point_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+    return type->tp_alloc(type, 0);
+}
+
+Py_ssize_t Point_sq_length(Point * self) {
+    return 2;
+}
+
+PyObject * Point_nb_add(PyObject * self, PyObject * other) {
+    Py_INCREF(self);
+    return self;
+}
+
+PyObject * Point_get_x(Point * self, void * closure) {
+    return PyLong_FromLong(self->x);
+}
+
+PyObject * Point_meth_noargs(Point * self) {
+    Py_RETURN_NONE;
+}
+
+long Point_meth_typed(Point * self, long value) {
+    return value;
+}
+
+PyObject * meth_noargs(PyObject * self) {
+    Py_RETURN_NONE;
+}
+
+PyObject * meth_varargs(PyObject * self, PyObject * args) {
+    Py_RETURN_NONE;
+}
+
+PyObject * meth_keywords(PyObject * self, PyObject * args, PyObject * kwargs) {
+    Py_RETURN_NONE;
+}
+
+PyObject * meth_fastcall(PyObject * self, PyObject * const * args, Py_ssize_t nargs) {
+    Py_RETURN_NONE;
+}
+
+long meth_typed(PyObject * self, long value) {
+    return value;
+}
+'''
+
+cases = [
+    ('METH_NOARGS', 'mod.noargs()'),
+    ('METH_VARARGS', 'mod.varargs(1)'),
+    ('METH_VARARGS | METH_KEYWORDS', 'mod.keywords(1, key=2)'),
+    ('METH_FASTCALL', 'mod.fastcall(1)'),
+    ('typed', 'mod.typed(1)'),
+    ('type METH_NOARGS', 'point.noargs()'),
+    ('type typed', 'point.typed(1)'),
+    ('tp_new', 'Point()'),
+    ('sq_length', 'len(point)'),
+    ('nb_add', 'point + point'),
+    ('getter', 'point.x'),
+    ('builtin baseline', 'len(())'),
+]
+
+
+def call_overhead(number=1000000, repeat=5, profile=False):
+    folder = tempfile.mkdtemp()
+
+    try:
+        mod = cfly.build_module(
+            'bench_calls_profiled' if profile else 'bench_calls',
+            source,
+            build_dir=os.path.join(folder, 'build'),
+            output_dir=folder,
+            profile=profile,
+        )
+
+        namespace = {'mod': mod, 'point': mod.Point(), 'Point': mod.Point}
+        results = []
+
+        for case, stmt in cases:
+            timings = timeit.repeat(stmt, globals=namespace, number=number, repeat=repeat)
+            results.append({
+                'name': 'call_overhead',
+                'case': case,
+                'profile': profile,
+                'stmt': stmt,
+                'number': number,
+                'repeat': repeat,
+                'ns_per_call': min(timings) / number * 1e9,
+            })
+
+        return results
+
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--profile', action='store_true', help='build the module with profile=True')
+    args = parser.parse_args()
+    print(json.dumps(call_overhead(args.number, args.repeat, args.profile), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+    Measure ``import cfly`` in a fresh interpreter.
+
+    usage: python benchmarks/import_time.py [--repeat 20]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+code = '''
+import sys
+import time
+start = time.perf_counter()
+import cfly
+print(time.perf_counter() - start)
+print(' '.join(sorted(sys.modules)))
+'''
+
+
+def import_time(repeat=20):
+    env = dict(os.environ, PYTHONPATH=root)
+    timings = []
+    for _ in range(repeat):
+        elapsed, modules = subprocess.check_output([sys.executable, '-c', code], env=env).decode().splitlines()
+        timings.append(float(elapsed))
+
+    heavy = [x for x in modules.split() if x.split('.')[0] in ('distutils', 'jinja2', 'subprocess', 'concurrent')]
+
+    return {
+        'name': 'import_time',
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'heavy_modules': heavy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(import_time(args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+    Measure ``parse_source`` on large generated sources, the scanner alone is compared
+    to the regular expressions it replaced.
+
+    usage: python benchmarks/parse_source.py [--lines 20000] [--repeat 5]
+'''
+
+import argparse
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cfly import core, scanner  # noqa: E402
+
+# the regular expressions the scanner replaced
+type_pattern = (
+    r'^\s*struct\s+([A-Za-z][A-Za-z0-9]*)\s*\{(\n\s*PyObject_HEAD\n'
+    r'(?:[^\{\}]*(?:\{(?:[^\{\}]*(?:\{(?:[^\{\}]*(?:\{[^\{\}]*\}[^\{\}]*)?)\}[^\{\}]*)?)\}[^\{\}]*)?))\};'
+)
+proc_pattern = (
+    r'^\s*([A-Za-z_][A-Za-z0-9_]*(?:\s*\*)?)\s*([A-Za-z][A-Za-z0-9]*)_([A-Za-z_][A-Za-z0-9_]*)'
+    r'\s*\(([^\)]*)\)\s*\{'
+)
+
+chunk = '''\
+struct Type%(i)d {
+    PyObject_HEAD
+    struct {
+        double x[4];
+        int flags;
+    } data;
+};
+
+/* Type%(i)d_meth_value returns the first element */
+PyObject * Type%(i)d_meth_value(Type%(i)d * self) {
+    if (self->data.flags) {
+        for (int j = 0; j < 4; ++j) {
+            self->data.x[j] += 1.0;
+        }
+    }
+    return PyFloat_FromDouble(self->data.x[0]);
+}
+
+PyObject * Type%(i)d_get_flags(Type%(i)d * self, void * closure) {
+    return PyLong_FromLong(self->data.flags);
+}
+
+PyObject * meth_make%(i)d(PyObject * self, PyObject * args) {
+    const char * name = "make%(i)d { }";
+    return PyUnicode_FromString(name);
+}
+
+'''
+
+
+def generate(lines, nested=False):
+    '''
+        A module with a type, a method, a getter and a function every 28 lines. With ``nested``
+        every chunk is in an ``extern "C"`` block, the definitions found are the same.
+    '''
+
+    size = chunk.count('\n')
+    template = 'extern "C" {\n' + chunk + '}\n' if nested else chunk
+    return '#include <Python.h>\n\n' + ''.join(template % {'i': i} for i in range(lines // size + 1))
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def parse_source(lines=20000, repeat=5, nested=False):
+    source = generate(lines, nested)
+
+    def legacy():
+        return re.findall(type_pattern, source, re.M), re.findall(proc_pattern, source, re.M)
+
+    # both sides must do the same work for the timings to compare
+    definitions = [len(types) + len(procs) for types, procs in (scanner.scan(source), legacy())]
+    if definitions[0] != definitions[1]:
+        raise RuntimeError('the scanner found %d definitions and the regexes %d' % tuple(definitions))
+
+    return {
+        'name': 'parse_source',
+        'input': 'extern "C"' if nested else 'module',
+        'lines': source.count('\n'),
+        'definitions': definitions[0],
+        'repeat': repeat,
+        'parse_source': measure(lambda: core.parse_source(source, io.BytesIO()), repeat),
+        'scan': measure(lambda: scanner.scan(source), repeat),
+        'regex': measure(legacy, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps([parse_source(args.lines, args.repeat, nested) for nested in (False, True)], indent=2))
+
+
+if __name__ == '__main__':
+    main()
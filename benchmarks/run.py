@@ -0,0 +1,104 @@
+'''
+    Run every benchmark and save the results as JSON, optionally compared to the results of another version.
+
+    usage: python benchmarks/run.py [--output results.json] [--compare baseline.json] [--quick]
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cfly  # noqa: E402
+from build_time import build_time  # noqa: E402
+from call_overhead import call_overhead  # noqa: E402
+from import_time import import_time  # noqa: E402
+from parse_source import parse_source  # noqa: E402
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def revision():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root, stderr=subprocess.DEVNULL)
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False):
+    repeat = 2 if quick else 5
+    results = [import_time(5 if quick else 20)]
+    results += [parse_source(2000 if quick else 20000, repeat, nested) for nested in (False, True)]
+    results += build_time(4 if quick else 8, repeat)
+    results += call_overhead(100000 if quick else 1000000, repeat)
+    results += call_overhead(100000 if quick else 1000000, repeat, profile=True)
+
+    return {
+        'cfly': cfly.__version__,
+        'revision': revision(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def metrics(report):
+    '''
+        Returns:
+            dict: The headline number of every result in seconds, lower is better.
+    '''
+
+    values = {}
+    for result in report['results']:
+        key = ' '.join(str(result[x]) for x in ('name', 'input', 'case') if x in result)
+        if result.get('profile'):
+            key += ' (profile)'
+        if 'ns_per_call' in result:
+            values[key] = result['ns_per_call'] * 1e-9
+        elif 'parse_source' in result:
+            values[key] = result['parse_source']['median']
+        else:
+            values[key] = result['median']
+    return values
+
+
+def compare(report, baseline):
+    new = metrics(report)
+    old = metrics(baseline)
+    rows = [(key, old[key], new[key], new[key] / old[key]) for key in new if old.get(key)]
+    width = max([len(key) for key, *_ in rows] + [9])
+
+    print('%-*s %12s %12s %8s' % (width, 'benchmark', 'baseline', 'current', 'ratio'))
+    for key, before, after, ratio in rows:
+        print('%-*s %12.3g %12.3g %7.2fx' % (width, key, before, after, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for a smoke test')
+    args = parser.parse_args()
+
+    report = run(args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,16 @@
     Build python extensions on-the-fly.
 '''
 
-from .core import build_module
+from .cache import cache_info, clear_cache, prune_cache
+from .core import build_module, build_module_async, build_modules, invalidate
 
-__all__ = ['build_module']
+__all__ = [
+    'build_module',
+    'build_module_async',
+    'build_modules',
+    'cache_info',
+    'clear_cache',
+    'invalidate',
+    'prune_cache',
+]
 __version__ = '1.0.2'
@@ -0,0 +1,204 @@
+'''
+    Content-addressed cache for objects and linked modules, shared by every build on the host.
+'''
+
+import hashlib
+import os
+import re
+import shutil
+import sys
+import sysconfig
+
+
+def default_cache_dir():
+    cache_dir = os.getenv('CFLY_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+
+    if sys.platform == 'win32':
+        return os.path.join(os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'cfly', 'cache')
+
+    return os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'cfly')
+
+
+def default_max_size():
+    return int(os.getenv('CFLY_CACHE_SIZE', 1 << 30))
+
+
+def python_abi():
+    return (sys.implementation.cache_tag, sysconfig.get_config_var('EXT_SUFFIX'), sys.version)
+
+
+def compiler_identity(command):
+    executable = shutil.which(command[0]) if command else None
+    if executable is None:
+        return tuple(command)
+
+    stat = os.stat(executable)
+    return tuple(command) + (os.path.realpath(executable), stat.st_size, stat.st_mtime)
+
+
+def object_key(preprocessed, compiler, macros, compiler_preargs, compiler_postargs):
+    '''
+        The cache key of an object file. Line markers are dropped from the preprocessed source,
+        so the same code compiled from a different module or build directory hits the same entry.
+    '''
+
+    digest = hashlib.sha256(re.sub(rb'^#(?:line)? \d+ .*$', b'', preprocessed, flags=re.M))
+    digest.update(repr((
+        compiler.compiler_type,
+        compiler_identity(getattr(compiler, 'compiler_so', None) or getattr(compiler, 'cc', 'cl.exe').split()),
+        macros,
+        compiler_preargs,
+        compiler_postargs,
+        python_abi(),
+    )).encode())
+    return digest.hexdigest()
+
+
+def module_key(object_keys, compiler, libraries, library_dirs, exports, linker_preargs, linker_postargs):
+    linker = getattr(compiler, 'linker_so', None) or getattr(compiler, 'linker', 'link.exe').split()
+    if getattr(compiler, 'linker_so', None) and getattr(compiler, 'compiler_cxx', None):
+        # modules are linked as c++, the c++ driver replaces the linker
+        linker = compiler.compiler_cxx[:1] + linker[1:]
+
+    digest = hashlib.sha256()
+    digest.update(repr((
+        object_keys,
+        compiler.compiler_type,
+        compiler_identity(linker),
+        compiler.library_dirs,
+        libraries,
+        library_dirs,
+        exports,
+        linker_preargs,
+        linker_postargs,
+        python_abi(),
+    )).encode())
+    return digest.hexdigest()
+
+
+class ObjectCache:
+    def __init__(self, path=None, max_size=None):
+        self.path = path or default_cache_dir()
+        self.max_size = default_max_size() if max_size is None else max_size
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def entries(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        result = []
+        for folder in os.scandir(self.path):
+            if folder.is_dir() and len(folder.name) == 2:
+                for entry in os.scandir(folder.path):
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        stat = entry.stat()
+                        result.append((stat.st_mtime, stat.st_size, entry.path))
+
+            # precompiled headers, a removed one is built again on its next use
+            elif folder.is_dir() and folder.name == 'pch':
+                for key in os.scandir(folder.path):
+                    for entry in os.scandir(key.path) if key.is_dir() else []:
+                        if entry.is_file() and entry.name.endswith('.gch') and not entry.name.startswith('.'):
+                            stat = entry.stat()
+                            result.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return result
+
+    def get(self, key, filename):
+        entry = self.entry(key)
+        try:
+            shutil.copyfile(entry, filename)
+            os.utime(entry)
+            return True
+
+        except FileNotFoundError:
+            return False
+
+    def put(self, key, filename):
+        entry = self.entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        temp = os.path.join(os.path.dirname(entry), '.' + os.urandom(8).hex())
+        shutil.copyfile(filename, temp)
+        os.replace(temp, entry)
+
+    def info(self):
+        entries = self.entries()
+        return {
+            'path': self.path,
+            'entries': len(entries),
+            'size': sum(size for mtime, size, path in entries),
+            'max_size': self.max_size,
+        }
+
+    def prune(self, max_size=None):
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, path in entries)
+        removed = 0
+
+        for mtime, size, path in entries:
+            if total <= max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+            removed += 1
+
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+
+default_cache = None
+
+
+def get_cache():
+    global default_cache
+    if default_cache is None or default_cache.path != default_cache_dir():
+        default_cache = ObjectCache()
+    return default_cache
+
+
+def cache_info():
+    '''
+        Returns:
+            dict: The location, number of entries, total size and size limit of the shared cache.
+    '''
+
+    return get_cache().info()
+
+
+def prune_cache(max_size=None):
+    '''
+        Remove the least recently used entries until the shared cache fits the size limit.
+
+        Args:
+            max_size (int): The size limit in bytes. defaults to ``CFLY_CACHE_SIZE`` or 1 GiB.
+
+        Returns:
+            int: The number of removed entries.
+    '''
+
+    return get_cache().prune(max_size)
+
+
+def clear_cache():
+    '''
+        Remove every entry from the shared cache.
+
+        Returns:
+            int: The number of removed entries.
+    '''
+
+    return get_cache().clear()
@@ -1,30 +1,140 @@
+import ast
+import contextlib
+import copy
+import errno
+import functools
 import hashlib
-import importlib
+import importlib.util
+import json
 import os
 import re
 import shutil
-import subprocess
 import sys
-from distutils.ccompiler import new_compiler
-from distutils.errors import CompileError, DistutilsExecError
-from distutils.sysconfig import customize_compiler, get_config_var, get_python_inc
+import sysconfig
+import time
 
-from jinja2 import Template
+from .cache import compiler_identity, get_cache, module_key, object_key, python_abi
+from .data import module_template, opt_profiles, pch_source, prefixes, source_template, tps
+from .scanner import scan
 
-from .data import module_template, prefixes, proc_pattern, source_template, tps, type_pattern
+registry = {}
+compiler_configs = {}
 
-re_type = re.compile(type_pattern, re.M)
-re_proc = re.compile(proc_pattern, re.M)
+compiler_env_vars = [
+    'AR', 'ARFLAGS', 'CC', 'CFLAGS', 'CPP', 'CPPFLAGS', 'CXX', 'DISTUTILS_USE_SDK', 'INCLUDE', 'LDFLAGS', 'LDSHARED',
+    'LIB', 'LIBPATH', 'MSSdk', 'PATH',
+]
 
 flags = ['METH_NOARGS', 'METH_NOARGS', 'METH_VARARGS', 'METH_VARARGS | METH_KEYWORDS']
+fastcall_flags = {3: 'METH_FASTCALL', 4: 'METH_FASTCALL | METH_KEYWORDS'}
+
+fastcall_pattern = re.compile(r'\s*PyObject\s*\*\s*const\s*\*')
+nogil_pattern = re.compile(r'\bCFLY_NOGIL\b\s*')
+space_pattern = re.compile(r'\s+')
+self_pattern = re.compile(r'\w+\*$')
+param_pattern = re.compile(r'(.*[\s*&])([A-Za-z_][A-Za-z0-9_]*)$', re.S)
+prefix_pattern = re.compile(r'([^_]+)_(.*)')
+slot_pattern = re.compile('(' + '|'.join(tps) + ')')
+vectorcall_pattern = re.compile(r'\bvectorcallfunc\s+vectorcall\s*;')
+freelist_pattern = re.compile(r'\bCFLY_FREELIST\s*\(\s*(\d+)\s*\)')
+
+# signatures that certainly follow the Python calling conventions, see is_typed
+conventional_rval = re.compile(r'\s*PyObject\s*\*\s*\Z')
+conventional_args = re.compile(r'''
+    \s*(?:void\s*|\w+\s*\*\s*\w*\s*(?:,\s*(?:PyObject\s*\*(?:\s*const\s*\*)?|Py_ssize_t\b)\s*\w*\s*){0,3})?\Z
+''', re.X)
+
+
+def method_flags(args):
+    '''
+        ``(self, PyObject * const * args, Py_ssize_t nargs[, PyObject * kwnames])`` is the fastcall convention,
+        any other signature is called with a tuple of arguments and a dict of keywords.
+    '''
+
+    params = args.split(',')
+    if len(params) in fastcall_flags and fastcall_pattern.match(params[1]):
+        return fastcall_flags[len(params)]
+
+    return flags[len(params)]
+
+
+def split_params(args):
+    params = []
+    depth = 0
+    start = 0
+
+    for i, c in enumerate(args):
+        if c in '<([{':
+            depth += 1
+
+        elif c in '>)]}':
+            depth -= 1
+
+        elif c == ',' and not depth:
+            params.append(args[start:i])
+            start = i + 1
+
+    params.append(args[start:])
+    params = [x.strip() for x in params if x.strip()]
+    return [] if params == ['void'] else params
+
+
+def is_typed(rval, params):
+    '''
+        Methods returning ``PyObject *`` and taking only ``PyObject *``, ``PyObject * const *`` and ``Py_ssize_t``
+        parameters follow the Python calling conventions, any other signature is typed.
+    '''
+
+    types = [space_pattern.sub('', param.type) for param in params]
+    conventions = ('PyObject*', 'PyObject*const*', 'Py_ssize_t')
+
+    if space_pattern.sub('', rval) != 'PyObject*' or len(params) > 4 or any(param.default for param in params):
+        return True
+
+    return not all(x in conventions or (i == 0 and self_pattern.match(x)) for i, x in enumerate(types))
+
+
+class Param:
+    def __init__(self, param):
+        self.default = None
+        if '=' in param:
+            param, self.default = (x.strip() for x in param.split('=', 1))
+
+        match = param_pattern.match(param)
+        self.type, self.name = (match.group(1).strip(), match.group(2)) if match else (param, '')
 
 
 class Meth:
     def __init__(self, rval, name, args):
         self.name = name
-        self.flags = flags[len(args.split(','))]
         self.args = args
-        self.rval = rval
+        self.nogil = 'CFLY_NOGIL' in rval and nogil_pattern.search(rval) is not None
+        self.rval = rval = nogil_pattern.sub('', rval) if self.nogil else rval
+        self.self_type = None
+
+        # the parameters are parsed only when the signature may be typed
+        if self.nogil or not conventional_rval.match(rval) or not conventional_args.match(args):
+            self.params = [Param(x) for x in split_params(args)]
+            self.typed = self.nogil or is_typed(rval, self.params)
+
+        else:
+            self.typed = False
+
+        if not self.typed:
+            self.flags = method_flags(args)
+
+        else:
+            self.flags = 'METH_FASTCALL | METH_KEYWORDS'
+            if self.params and self.params[0].name == 'self':
+                self.self_type = self.params.pop(0).type
+
+            defaults = [x.default is not None for x in self.params]
+            self.required = defaults.index(True) if True in defaults else len(defaults)
+            self.void = space_pattern.sub('', rval) == 'void'
+            call_args = ['arg%d.value' % i for i in range(len(self.params))]
+            if self.self_type:
+                call_args.insert(0, '(%s)self' % self.self_type)
+            self.call_args = ', '.join(call_args)
 
 
 class GetSet:
@@ -38,11 +148,17 @@ class Type:
     def __init__(self, name, struct):
         self.name = name
         self.struct = struct
+        self.vectorcall = vectorcall_pattern.search(struct) is not None
+        freelist = freelist_pattern.search(struct)
+        self.freelist = int(freelist.group(1)) if freelist else 0
         self.methods = {}
         self.getset = {}
 
 
-def create_compiler():
+def discover_compiler():
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler, get_python_inc
+
     compiler = new_compiler()
     if hasattr(compiler, 'initialize'):
         compiler.initialize()
@@ -58,6 +174,76 @@ def create_compiler():
     return compiler
 
 
+def is_literal(value):
+    if isinstance(value, (list, tuple)):
+        return all(is_literal(x) for x in value)
+
+    if isinstance(value, dict):
+        return all(is_literal(k) and is_literal(v) for k, v in value.items())
+
+    return value is None or isinstance(value, (str, int, float))
+
+
+def compiler_executable(fields):
+    return fields.get('compiler_so') or [fields.get('cc') or '']
+
+
+def read_compiler_config(build_dir, fingerprint):
+    content = readall(build_dir, 'compiler.txt')
+    if content is None:
+        return None
+
+    # a damaged or outdated file is discovered again
+    try:
+        config = ast.literal_eval(content)
+
+        if config['fingerprint'] != fingerprint:
+            return None
+
+        if config['identity'] != repr(compiler_identity(compiler_executable(config['fields']))):
+            return None
+
+        return config['compiler_type'], config['fields']
+
+    except (SyntaxError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def create_compiler(build_dir=None):
+    '''
+        Create a compiler without probing the environment again. The resolved configuration is kept
+        in this process and in ``{build_dir}/compiler.txt``, it is discovered again when the interpreter,
+        the compiler executable or the relevant environment variables change.
+    '''
+
+    from distutils.ccompiler import new_compiler
+
+    fingerprint = args_checksum(sys.executable, sys.version, [os.getenv(x) for x in compiler_env_vars])
+    config = compiler_configs.get(fingerprint)
+
+    if config is None and build_dir:
+        config = read_compiler_config(build_dir, fingerprint)
+
+    if config is None:
+        compiler = discover_compiler()
+        fields = {k: v for k, v in vars(compiler).items() if is_literal(v)}
+        config = compiler.compiler_type, fields
+
+        if build_dir:
+            writeall(build_dir, 'compiler.txt', repr({
+                'fingerprint': fingerprint,
+                'identity': repr(compiler_identity(compiler_executable(fields))),
+                'compiler_type': compiler.compiler_type,
+                'fields': fields,
+            }))
+
+    compiler_configs[fingerprint] = config
+    compiler_type, fields = config
+    compiler = new_compiler(compiler=compiler_type)
+    vars(compiler).update(copy.deepcopy(fields))
+    return compiler
+
+
 def load_module(name, path):
     spec = importlib.util.spec_from_file_location(name, path)
     mod = importlib.util.module_from_spec(spec)
@@ -67,14 +253,15 @@ def load_module(name, path):
 
 def parse_source(source, build_log):
     module_methods = {}
-    module_types = {name: Type(name, content) for name, content in re_type.findall(source)}
+    types, procs = scan(source)
+    module_types = {name: Type(name, content) for name, content in types}
 
-    for rval, typ, name, args in re_proc.findall(source):
+    for rval, typ, name, args in procs:
         if typ == 'meth':
             module_methods[name] = Meth(rval, name, args)
 
         elif typ in module_types:
-            name_match = re.match(r'([^_]+)_(.*)', name)
+            name_match = prefix_pattern.match(name)
 
             if name_match:
                 prefix, rest = name_match.groups()
@@ -85,11 +272,11 @@ def parse_source(source, build_log):
 
                 elif prefix in ('get', 'set'):
                     module_types[typ].getset.setdefault(rest, GetSet(rest))
-                    setattr(module_types[typ].getset[rest], prefix, Meth(rval, '%(typ)s_%(name)s' % locals(), args))
+                    setattr(module_types[typ].getset[rest], prefix, '%(typ)s_%(name)s' % locals())
                     setattr(module_types[typ], 'tp_getset', '%(typ)s_tp_getset' % locals())
 
                 elif prefix in prefixes:
-                    if re.match('(' + '|'.join(tps) + ')', name):
+                    if slot_pattern.match(name):
                         setattr(module_types[typ], name, '%(typ)s_%(name)s' % locals())
                         alias = prefixes[prefix]
                         if alias:
@@ -107,11 +294,57 @@ def parse_source(source, build_log):
         else:
             build_log.write(('Unknown type %(typ)s in %(typ)s_%(name)s\n' % locals()).encode())
 
+    for typ in module_types.values():
+        if typ.freelist and (getattr(typ, 'tp_alloc', None) or getattr(typ, 'tp_free', None)):
+            build_log.write(('CFLY_FREELIST is ignored for %s, it defines tp_alloc or tp_free\n' % typ.name).encode())
+            typ.freelist = 0
+
     build_log.flush()
 
     return module_methods, module_types
 
 
+def profiled_functions(module_methods, module_types):
+    '''
+        Returns:
+            list: ``(function, label)`` pairs for every function called from a method table or a type slot.
+    '''
+
+    functions = []
+
+    for meth in module_methods.values():
+        functions.append((('__cfly_' if meth.typed else '') + 'meth_' + meth.name, meth.name))
+
+    for typ in module_types.values():
+        for meth in typ.methods.values():
+            function = '%s_meth_%s' % (typ.name, meth.name)
+            functions.append((('__cfly_' if meth.typed else '') + function, typ.name + '.' + meth.name))
+
+        for getset in typ.getset.values():
+            for accessor in (getset.get, getset.set):
+                if accessor:
+                    functions.append((accessor, accessor.replace('_', '.', 1)))
+
+        # the tables and the base type are not functions
+        tables = ('tp_base', 'tp_getset', 'tp_methods') + tuple(prefixes.values())
+
+        for slot in tps:
+            if getattr(typ, slot, None) and slot not in tables:
+                functions.append((getattr(typ, slot), typ.name + '.' + slot))
+
+    return functions
+
+
+def profiled(function):
+    if not function:
+        return function
+    return 'cfly::profiled<decltype(&%(function)s), &%(function)s, &__cfly_counter_%(function)s>::call' % locals()
+
+
+def unprofiled(function):
+    return function
+
+
 def is_up_to_date(filename, deps):
     if not os.path.isfile(filename):
         return False
@@ -119,7 +352,11 @@ def is_up_to_date(filename, deps):
     if not deps:
         return True
 
-    return os.path.getmtime(filename) > max(os.path.getmtime(x) for x in deps)
+    try:
+        return os.path.getmtime(filename) > max(os.path.getmtime(x) for x in deps)
+
+    except OSError:
+        return False
 
 
 def readall(folder, filename):
@@ -133,17 +370,514 @@ def readall(folder, filename):
 def writeall(folder, filename, content):
     filename = os.path.join(folder, filename)
     os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, 'w') as f:
+    temp = os.path.join(os.path.dirname(filename), '.' + os.urandom(8).hex())
+    with open(temp, 'w') as f:
         f.write(content)
+    os.replace(temp, filename)
     return filename
 
 
+@contextlib.contextmanager
+def file_lock(filename):
+    '''
+        Exclusive lock shared between processes, held while the file is open.
+    '''
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def publish(filename, output, build_dir):
+    folder = os.path.dirname(os.path.abspath(output))
+    os.makedirs(folder, exist_ok=True)
+
+    try:
+        replace_output(filename, output, build_dir)
+
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+
+        # the build directory is on another filesystem, a copy next to the output is renamed in place
+        temp = os.path.join(folder, '.' + os.urandom(8).hex())
+        shutil.copy2(filename, temp)
+
+        try:
+            replace_output(temp, output, build_dir)
+
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+        os.unlink(filename)
+
+
+def replace_output(filename, output, build_dir):
+    try:
+        os.replace(filename, output)
+
+    except PermissionError:
+        shutil.move(output, os.path.join(build_dir, '_' + os.urandom(8).hex()))
+        os.replace(filename, output)
+
+
+def updateall(folder, filename, content):
+    if readall(folder, filename) == content:
+        return os.path.join(folder, filename)
+    return writeall(folder, filename, content)
+
+
+def generated_name(filename):
+    drive, path = os.path.splitdrive(os.path.normpath(filename))
+    return os.path.join(*['__' if x == '..' else x for x in re.split(r'[\\/]', path) if x])
+
+
+def line_directive(line, filename):
+    return '#line %d "%s"\n' % (line, filename.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def clock():
+    return time.perf_counter(), time.process_time()
+
+
+def add_phase(stats, phase, since):
+    wall, cpu = clock()
+    times = stats['phases'].setdefault(phase, {'wall': 0.0, 'cpu': 0.0})
+    times['wall'] += wall - since[0]
+    times['cpu'] += cpu - since[1]
+
+
+@contextlib.contextmanager
+def timed(stats, phase):
+    since = clock()
+    try:
+        yield
+    finally:
+        add_phase(stats, phase, since)
+
+
+def finish_report(stats, result, started):
+    wall, cpu = clock()
+    stats.update(result=result, wall=wall - started[0], cpu=cpu - started[1])
+    return stats
+
+
+def rebuild_reason(cache, checksum, old_checksum, output, deps):
+    '''
+        Returns:
+            str: Why the module has to be built, None when it is up to date.
+    '''
+
+    if not cache:
+        return 'cache disabled'
+
+    if old_checksum is None:
+        return 'first build'
+
+    if checksum != old_checksum:
+        return 'arguments changed'
+
+    if not os.path.isfile(output):
+        return 'output missing'
+
+    if not is_up_to_date(output, deps):
+        changed = [x for x in deps if not os.path.isfile(x) or os.path.getmtime(x) >= os.path.getmtime(output)]
+        return 'dependency changed: ' + ', '.join(changed)
+
+    return None
+
+
+def read_state(folder):
+    content = readall(folder, 'state.json')
+    if content is None:
+        return {'link': None, 'objects': {}}
+    return json.loads(content)
+
+
+def freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    return value
+
+
+def register_module(fingerprint, name, path):
+    registry[fingerprint] = load_module(name, path)
+    return registry[fingerprint]
+
+
+def invalidate(name=None):
+    '''
+        Forget the modules built in this process, the next :func:`build_module` call checks the build again.
+
+        Args:
+            name (str): Forget only the modules with this name. defaults to all modules.
+    '''
+
+    for fingerprint in [x for x in registry if name is None or x[1] == name]:
+        del registry[fingerprint]
+
+
 def args_checksum(*args):
     return hashlib.sha512(str(args).encode()).hexdigest()
 
 
-def render_template(template, **kwargs):
-    template = Template(
+def compiler_env(compiler):
+    if not hasattr(compiler, '_paths'):
+        return None
+    return dict(os.environ, PATH=getattr(compiler, '_paths'))
+
+
+def run_commands(commands, env):
+    import subprocess
+
+    start = time.perf_counter()
+    output = b''
+    for cmd in commands:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        output += proc.stdout
+        if proc.returncode:
+            return False, output, time.perf_counter() - start
+    return True, output, time.perf_counter() - start
+
+
+async def run_commands_async(commands, env):
+    import asyncio
+
+    start = time.perf_counter()
+    output = b''
+    for cmd in commands:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+            start_new_session=os.name == 'posix',
+        )
+
+        try:
+            stdout, stderr = await proc.communicate()
+
+        except BaseException:
+            if os.name == 'posix':
+                import signal
+
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+            elif proc.returncode is None:
+                proc.kill()
+
+            # the process is killed, wait for its pipes to close even if cancelled again
+            while True:
+                try:
+                    await proc.communicate()
+                    break
+
+                except asyncio.CancelledError:
+                    pass
+
+            raise
+
+        output += stdout
+        if proc.returncode:
+            return False, output, time.perf_counter() - start
+    return True, output, time.perf_counter() - start
+
+
+def run_parallel(func, items, jobs):
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs > 1 and len(items) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(min(jobs, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    return [func(x) for x in items]
+
+
+def record_commands(compiler, method, *args):
+    recorded = []
+    compiler.spawn = recorded.append
+    method(*args)
+    return recorded
+
+
+def dependency_args(compiler, obj):
+    if compiler.compiler_type == 'msvc':
+        return ['/showIncludes']
+    return ['-MMD', '-MF', obj + '.d']
+
+
+def read_dependencies(compiler, source, obj, output):
+    if compiler.compiler_type == 'msvc':
+        prefix = b'Note: including file:'
+        deps = [source]
+        lines = []
+        for line in output.splitlines(True):
+            if line.startswith(prefix):
+                deps.append(line[len(prefix):].strip().decode())
+            else:
+                lines.append(line)
+        return [os.path.abspath(x) for x in deps], b''.join(lines)
+
+    content = readall('.', obj + '.d')
+    if content is None:
+        return None, output
+
+    rules = content.replace('\\\n', ' ').partition(': ')[2]
+    deps = [x.replace('\\ ', ' ') for x in re.findall(r'(?:\\ |\S)+', rules)]
+    return [os.path.abspath(x) for x in deps], output
+
+
+def fail(build_log, error, output=b''):
+    build_log.write(output)
+    build_log.flush()
+    build_log.seek(0)
+    entire_log = build_log.read().decode()
+    raise error('Compiler failed:\n' + entire_log)
+
+
+def precompiled_header(compiler, folder, macros, compiler_preargs, compiler_postargs, build_log):
+    '''
+        Build the precompiled header once per compiler, flags and Python version.
+        Only gcc and clang compatible compilers are supported, None is returned for the others.
+    '''
+
+    if compiler.compiler_type not in ('unix', 'mingw32', 'cygwin'):
+        return None
+
+    from distutils.ccompiler import gen_preprocess_options
+
+    key = args_checksum(compiler.compiler_so, compiler.include_dirs, macros, compiler_preargs, compiler_postargs,
+                        python_abi(), pch_source)[:32]
+    header = os.path.join(folder, key, 'cfly.hpp')
+
+    if os.path.isfile(header + '.gch'):
+        try:
+            # the shared cache evicts the least recently used headers
+            os.utime(header + '.gch')
+        except FileNotFoundError:
+            pass
+        return header
+
+    if readall(folder, os.path.join(key, 'cfly.hpp')) != pch_source:
+        temp = writeall(folder, os.path.join(key, '.' + os.urandom(8).hex()), pch_source)
+        os.replace(temp, header)
+
+    temp = os.path.join(folder, key, '.' + os.urandom(8).hex() + '.gch')
+    cmd = compiler.compiler_so + ['-x', 'c++-header'] + (compiler_preargs or [])
+    cmd += gen_preprocess_options(macros or [], compiler.include_dirs)
+    cmd += [header, '-o', temp] + (compiler_postargs or [])
+    [(success, output, seconds)] = yield [[cmd]], compiler_env(compiler)
+
+    if not success:
+        build_log.write(b'Cannot build the precompiled header:\n' + output)
+        build_log.flush()
+        return None
+
+    os.replace(temp, header + '.gch')
+    return header
+
+
+def unity_source(sources):
+    return ''.join('#include "%s"\n' % os.path.abspath(source).replace('\\', '/') for source, original in sources)
+
+
+def original_folders(original):
+    return [os.path.abspath(os.path.dirname(original))] if original else []
+
+
+def source_preargs(compiler, source, header, compiler_preargs):
+    '''
+        The precompiled header holds the C++ runtime, it is only included by C++ sources.
+    '''
+
+    if header and compiler.detect_language(source) == 'c++':
+        return ['-include', header] + (compiler_preargs or [])
+    return compiler_preargs
+
+
+def object_keys(compiler, todo, objects, macros, header, compiler_preargs, compiler_postargs):
+    for obj in objects:
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+
+    preargs = [source_preargs(compiler, source, header, compiler_preargs) for source, original in todo]
+    commands = [
+        record_commands(
+            compiler,
+            compiler.preprocess,
+            source,
+            None,
+            macros,
+            original_folders(original),
+            None,
+            (source_args or []) + (compiler_postargs or []) + dependency_args(compiler, obj) + ['-o', obj + '.ii'],
+        )
+        for (source, original), obj, source_args in zip(todo, objects, preargs)
+    ]
+
+    if not all(len(x) == 1 for x in commands):
+        return [None] * len(todo)
+
+    results = yield commands, compiler_env(compiler)
+    keys = []
+
+    for (success, output, seconds), obj, source_args in zip(results, objects, preargs):
+        keys.append(None)
+        if success:
+            with open(obj + '.ii', 'rb') as f:
+                keys[-1] = object_key(f.read(), compiler, macros, source_args, compiler_postargs)
+            os.unlink(obj + '.ii')
+
+    return keys
+
+
+def compile_objects(
+        compiler, todo, objects, keys, object_cache, lookup, build_dir, macros, header, compiler_preargs,
+        compiler_postargs, build_log, stats):
+
+    hits = [bool(key and lookup and object_cache.get(key, obj)) for obj, key in zip(objects, keys)]
+    commands = [
+        record_commands(
+            compiler,
+            compiler.compile,
+            [source],
+            build_dir,
+            macros,
+            original_folders(original),
+            0,
+            source_preargs(compiler, source, header, compiler_preargs),
+            (compiler_postargs or []) + dependency_args(compiler, obj),
+        )
+        for (source, original), obj, hit in zip(todo, objects, hits) if not hit
+    ]
+
+    results = iter((yield commands, compiler_env(compiler)))
+    failed = False
+    deps = []
+
+    for (source, original), obj, key, hit in zip(todo, objects, keys, hits):
+        success, output, seconds = (True, b'', 0.0) if hit else next(results)
+        if success and key and not hit:
+            object_cache.put(key, obj)
+
+        stats['objects'].append({
+            'source': source,
+            'object': obj,
+            'cache': 'hit' if hit else 'miss' if object_cache else 'disabled',
+            'seconds': seconds,
+        })
+
+        obj_deps, output = read_dependencies(compiler, source, obj, output)
+        build_log.write(output)
+        failed = failed or not success
+        deps.append(obj_deps)
+
+    build_log.flush()
+
+    if failed:
+        from distutils.errors import CompileError
+
+        fail(build_log, CompileError)
+
+    return deps
+
+
+def run_steps(steps, jobs):
+    '''
+        Run a build generator, the commands it yields are executed in a thread pool.
+    '''
+
+    results = None
+    while True:
+        try:
+            commands, env = steps.send(results)
+
+        except StopIteration as ex:
+            return ex.value
+
+        results = run_parallel(lambda x: run_commands(x, env), commands, jobs)
+
+
+async def run_steps_async(steps, jobs):
+    '''
+        Run a build generator, the commands it yields are executed as asyncio subprocesses.
+        The generator itself is advanced in a worker thread to keep the event loop responsive.
+    '''
+
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(1)
+    semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
+
+    def advance(results):
+        try:
+            return False, steps.send(results)
+
+        except StopIteration as ex:
+            return True, ex.value
+
+    async def run(commands, env):
+        async with semaphore:
+            return await run_commands_async(commands, env)
+
+    pending = None
+
+    try:
+        results = None
+        while True:
+            pending = executor.submit(advance, results)
+            done, value = await asyncio.wrap_future(pending)
+
+            if done:
+                return value
+
+            commands, env = value
+            results = await asyncio.gather(*[run(x, env) for x in commands])
+
+    finally:
+        if pending is not None and not pending.done():
+            await asyncio.wait([asyncio.wrap_future(pending)])
+
+        executor.shutdown(wait=False)
+        steps.close()
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(template):
+    from jinja2 import Template
+
+    return Template(
         template,
         block_start_string='/*%',
         block_end_string='%*/',
@@ -151,7 +885,10 @@ def render_template(template, **kwargs):
         variable_end_string='}*/',
         line_statement_prefix='///',
     )
-    code = template.render(**kwargs)
+
+
+def render_template(template, **kwargs):
+    code = compile_template(template).render(**kwargs)
     code = re.sub(r'^//!$', '', code, flags=re.M)
     return code
 
@@ -159,7 +896,9 @@ def render_template(template, **kwargs):
 def build_module(
         name, source=None, *, sources=None, preprocess=None, output=None, output_dir='.',
         build_dir='build', include_dirs=None, library_dirs=None, libraries=None, macros=None,
-        compiler_preargs=None, compiler_postargs=None, linker_preargs=None, linker_postargs=None, cache=True):
+        compiler_preargs=None, compiler_postargs=None, linker_preargs=None, linker_postargs=None, cache=True,
+        jobs=None, shared_cache=True, pch=True, opt=None, pgo=None, unity=False, report=None,
+        profile=False, server=None):
 
     '''
         Args:
@@ -182,13 +921,198 @@ def build_module(
             linker_preargs (list): Linker preargs.
             linker_postargs (list): Linker postargs.
             cache (bool): Enable cache.
+            jobs (int): Number of parallel compiler processes. defaults to the CPU count.
+            shared_cache (bool): Reuse objects and modules from the shared cache. defaults to True.
+            pch (bool): Include a precompiled ``Python.h`` in every source. defaults to True.
+            opt (str): Optimization profile for every source and the link, one of 'debug', 'release', 'native'
+                (release tuned for the build machine) and 'lto' (release with link time optimization).
+                defaults to the flags Python was built with.
+            pgo (callable): Profile guided optimization. The module is built with instrumentation and this
+                function is called with it in a subprocess, then the module is built again with the collected
+                profile. The function must be picklable. Requires gcc.
+            unity (bool or int): Compile the C++ sources together, ``#include``-d into a single translation unit
+                or into units of this many sources. C sources are still compiled one by one.
+                defaults to one translation unit per source.
+            report (callable): Called with the build report, a dict with the result ('registry', 'up_to_date'
+                or 'built'), the reason of the rebuild, the wall and CPU seconds of every phase and the cache
+                decision and compile time of every object. A report of each build is also written to
+                ``{build_dir}/temp/{name}/report.json``.
+            profile (bool): Count the calls and the time spent in every method, getter, setter and slot,
+                see ``module.__cfly_stats__(reset=False)``.
+            server (str): The socket of a build server started with ``python -m cfly.server``, the module is
+                built by the server and loaded here. defaults to ``CFLY_SERVER``, builds locally when unset.
+
+        Returns:
+            the compiled and imported module. Repeated calls with the same arguments return the
+            same module object without checking the build, see :func:`invalidate`.
+    '''
+
+    kwargs = locals()
+    del kwargs['jobs']
+    return run_steps(build_steps(**kwargs), jobs)
+
+
+async def build_module_async(name, source=None, *, jobs=None, timeout=None, **kwargs):
+    '''
+        Same as :func:`build_module` but the compiler and the linker run as asyncio subprocesses,
+        the event loop is not blocked while the module is built. Cancelling the task kills the
+        running compiler processes.
+
+        Args:
+            name (str): The module name (must be unique).
+            source (str): the source code in C++.
+
+        Keyword Args:
+            jobs (int): Number of parallel compiler processes. defaults to the CPU count.
+            timeout (float): Cancel the build after this many seconds. defaults to no timeout.
+            **kwargs: The keyword arguments of :func:`build_module`.
 
         Returns:
             the compiled and imported module.
     '''
 
+    import asyncio
+
+    return await asyncio.wait_for(run_steps_async(build_steps(name, source, **kwargs), jobs), timeout)
+
+
+def build_modules(specs, *, jobs=None):
+    '''
+        Build many modules at once. The compiler and linker jobs of every module share one worker pool,
+        a module is linked as soon as its own objects are ready.
+
+        Args:
+            specs (list): The keyword arguments of :func:`build_module` for each module, including ``name``.
+
+        Keyword Args:
+            jobs (int): Number of parallel compiler processes. defaults to the CPU count.
+
+        Returns:
+            dict: The compiled and imported modules by name. A module that failed to build maps to
+            the exception raised while building it, the other modules are built regardless.
+    '''
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    specs = [dict(spec) for spec in specs]
+    names = [spec['name'] for spec in specs]
+
+    if len(set(names)) != len(names):
+        raise ValueError('duplicate module names')
+
+    modules = {}
+    running = {}
+    pending = {}
+
+    def advance(name, steps, results):
+        while True:
+            try:
+                commands, env = steps.send(results)
+
+            except StopIteration as ex:
+                modules[name] = ex.value
+                return
+
+            except Exception as ex:
+                modules[name] = ex
+                return
+
+            if commands:
+                break
+
+            results = []
+
+        running[name] = [None] * len(commands)
+        for index, cmd in enumerate(commands):
+            pending[pool.submit(run_commands, cmd, env)] = name, steps, index
+
+    with ThreadPoolExecutor(jobs or os.cpu_count() or 1) as pool:
+        for spec in specs:
+            advance(spec['name'], build_steps(**spec), None)
+
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, steps, index = pending.pop(future)
+                running[name][index] = future.result()
+                if all(x is not None for x in running[name]):
+                    advance(name, steps, running.pop(name))
+
+    return {name: modules[name] for name in names}
+
+
+def build_steps(
+        name, source=None, *, sources=None, preprocess=None, output=None, output_dir='.',
+        build_dir='build', include_dirs=None, library_dirs=None, libraries=None, macros=None,
+        compiler_preargs=None, compiler_postargs=None, linker_preargs=None, linker_postargs=None, cache=True,
+        shared_cache=True, pch=True, opt=None, pgo=None, unity=False, report=None, profile=False,
+        server=None, load=True, pgo_data=None):
+
+    '''
+        The build of a module as a generator. Every compiler or linker invocation is yielded as
+        a list of jobs with their environment, the results are sent back as (success, output, seconds) triples.
+        The loaded module is the return value, or the path of the module when ``load`` is False.
+        ``pgo_data`` is a folder written by :func:`pgo_steps` with the profile data of every source.
+    '''
+
+    kwargs = dict(locals())
+
+    fingerprint = freeze((
+        os.getcwd(),
+        name,
+        source,
+        sources,
+        preprocess,
+        output,
+        output_dir,
+        build_dir,
+        include_dirs,
+        library_dirs,
+        libraries,
+        macros,
+        compiler_preargs,
+        compiler_postargs,
+        linker_preargs,
+        linker_postargs,
+        opt,
+        pgo,
+        unity,
+        profile,
+    ))
+
+    started = clock()
+    stats = {'name': name, 'result': None, 'reason': None, 'phases': {}, 'objects': [], 'module_cache': None}
+
+    if load and cache and fingerprint in registry:
+        if report:
+            report(finish_report(stats, 'registry', started))
+        return registry[fingerprint]
+
+    if opt is not None and opt not in opt_profiles['unix']:
+        raise ValueError('invalid opt')
+
+    if unity is not True and unity is not False and (not isinstance(unity, int) or unity < 1):
+        raise ValueError('invalid unity')
+
+    if server is None:
+        server = os.getenv('CFLY_SERVER')
+
+    if server and load:
+        if pgo is not None:
+            raise ValueError('pgo is not supported by the build server')
+
+        response = build_remote(server, kwargs)
+        module = register_module(fingerprint, name, response['path'])
+        if report:
+            report(response['report'])
+        return module
+
+    if pgo is not None:
+        registry[fingerprint] = yield from pgo_steps(pgo, kwargs)
+        return registry[fingerprint]
+
     if output is None:
-        output = name + get_config_var('EXT_SUFFIX')
+        output = name + sysconfig.get_config_var('EXT_SUFFIX')
 
     if sources is None:
         sources = []
@@ -208,7 +1132,6 @@ def build_module(
     os.makedirs(build_dir, exist_ok=True)
 
     module_home = os.path.join(build_dir, 'temp', name)
-    old_checksum = readall(module_home, 'args.txt')
     checksum = args_checksum(
         name,
         source,
@@ -225,22 +1148,90 @@ def build_module(
         compiler_postargs,
         linker_preargs,
         linker_postargs,
+        pch,
+        opt,
+        unity,
+        profile,
+        pgo_data,
     )
 
-    if checksum != old_checksum:
-        cache = False
-
     output = os.path.join(output_dir, output)
-
-    if cache and is_up_to_date(output, sources + preprocess):
-        return load_module(name, output)
+    stats['output'] = output
+
+    def stale():
+        with timed(stats, 'check'):
+            state = read_state(module_home)
+            deps = sources + preprocess + sorted({x for obj in state['objects'].values() for x in obj['deps']})
+            return rebuild_reason(cache, checksum, readall(module_home, 'args.txt'), output, deps)
+
+    def finish(result):
+        module = output
+        if load:
+            with timed(stats, 'load'):
+                module = register_module(fingerprint, name, output)
+
+        if report:
+            report(finish_report(stats, result, started))
+        return module
+
+    if not stale():
+        return finish('up_to_date')
+
+    waiting = clock()
+    with file_lock(os.path.join(build_dir, 'temp', name + '.lock')):
+        add_phase(stats, 'lock', waiting)
+
+        # another process may have published the module while this one was waiting for the lock
+        stats['reason'] = stale()
+        if not stats['reason']:
+            return finish('up_to_date')
+
+        yield from build_locked(
+            name,
+            source,
+            sources,
+            preprocess,
+            output,
+            build_dir,
+            module_home,
+            include_dirs,
+            library_dirs,
+            libraries,
+            macros,
+            compiler_preargs,
+            compiler_postargs,
+            linker_preargs,
+            linker_postargs,
+            cache,
+            shared_cache,
+            pch,
+            opt,
+            unity,
+            profile,
+            pgo_data,
+            checksum,
+            stats,
+        )
+
+        writeall(module_home, 'report.json', json.dumps(finish_report(stats, 'built', started), indent=2))
+
+    return finish('built')
+
+
+def build_locked(
+        name, source, sources, preprocess, output, build_dir, module_home, include_dirs, library_dirs, libraries,
+        macros, compiler_preargs, compiler_postargs, linker_preargs, linker_postargs, cache, shared_cache, pch, opt,
+        unity, profile, pgo_data, checksum, stats):
+
+    state = read_state(module_home)
+
+    from distutils.errors import CompileError, LinkError
 
     with open(os.path.join(build_dir, name + '.log'), 'wb+') as build_log:
-        shutil.rmtree(module_home, ignore_errors=True)
         os.makedirs(module_home, exist_ok=True)
 
         if source:
-            preprocess = [writeall(module_home, 'source.cpp', source)]
+            preprocess = [updateall(module_home, 'source.cpp', source)]
 
         global_module_methods = {}
         global_module_types = {}
@@ -249,89 +1240,377 @@ def build_module(
 
         for filename in preprocess:
             source = readall('.', filename)
-            module_methods, module_types = parse_source(source, build_log)
+            with timed(stats, 'parse'):
+                module_methods, module_types = parse_source(source, build_log)
             global_module_methods.update(module_methods)
             global_module_types.update(module_types)
-            code = render_template(source_template, module=name, types=module_types, methods=module_methods)
-            sources.append((writeall(module_home, filename, source + code), filename))
-
-        code = render_template(module_template, module=name, types=global_module_types, methods=global_module_methods)
-        sources.append((writeall(module_home, 'module.cpp', code), None))
+            with timed(stats, 'render'):
+                code = render_template(
+                    source_template,
+                    module=name,
+                    types=module_types,
+                    methods=module_methods,
+                    counters=profiled_functions(module_methods, module_types) if profile else [],
+                    wrap=profiled if profile else unprofiled,
+                )
+            # diagnostics point to the original file, then to the generated code
+            generated = os.path.join(module_home, generated_name(filename))
+            source = pch_source + line_directive(1, os.path.abspath(filename)) + source.rstrip('\n') + '\n'
+            source += line_directive(source.count('\n') + 2, generated) + code
+            sources.append((updateall(module_home, generated_name(filename), source), filename))
+
+        with timed(stats, 'render'):
+            code = render_template(
+                module_template,
+                module=name,
+                types=global_module_types,
+                methods=global_module_methods,
+                profile=profile,
+            )
+
+        if profile:
+            code = pch_source + code
+
+        sources.append((updateall(module_home, 'module.cpp', code), None))
         exports = ['PyInit_' + name]
 
-        compiler = create_compiler()
+        with timed(stats, 'compiler'):
+            compiler = create_compiler(build_dir)
 
-        def spawn(cmd):
-            old_path = os.getenv('path', '')
-            try:
-                os.environ['path'] = getattr(compiler, '_paths', old_path)
-                ret = subprocess.call(cmd, stdout=build_log, stderr=subprocess.STDOUT)
-                if ret:
-                    build_log.seek(0)
-                    entire_log = build_log.read().decode()
-                    raise DistutilsExecError('Compiler failed:\n' + entire_log)
+        for include_dir in include_dirs or []:
+            compiler.add_include_dir(include_dir)
 
-            finally:
-                build_log.flush()
-                os.environ['path'] = old_path
+        if unity:
+            # the folders of the preprocessed files are searched by every unit
+            for folder in dict.fromkeys(x for source, original in sources for x in original_folders(original)):
+                compiler.add_include_dir(folder)
 
-        compiler.spawn = spawn
+            # C sources are not valid C++, they stay separate translation units
+            batched = [x for x in sources if compiler.detect_language(x[0]) == 'c++']
+            separate = [x for x in sources if compiler.detect_language(x[0]) != 'c++']
 
-        for include_dir in include_dirs or []:
-            compiler.add_include_dir(include_dir)
+            size = len(batched) if unity is True else unity
+            sources = [
+                (updateall(module_home, 'unity-%d.cpp' % index, unity_source(batched[start:start + size])), None)
+                for index, start in enumerate(range(0, len(batched), size))
+            ] + separate
 
         for library_dir in library_dirs or []:
             compiler.add_library_dir(library_dir)
 
+        if opt is not None:
+            compile_flags, link_flags = opt_profiles['msvc' if compiler.compiler_type == 'msvc' else 'unix'][opt]
+            compiler_preargs = compile_flags + (compiler_preargs or [])
+            linker_preargs = link_flags + (linker_preargs or [])
+
+        compile_checksum = args_checksum(macros, include_dirs, compiler_preargs, compiler_postargs, pch)
+        link_checksum = args_checksum(libraries, library_dirs, linker_preargs, linker_postargs)
+
         try:
             objects = compiler.object_filenames([source for source, original in sources], 0, build_dir)
+            new_state = {'link': link_checksum, 'objects': {}}
 
             todo = []
             for pair, obj in zip(sources, objects):
-                source, original = pair
-                if not is_up_to_date(obj, [original or source]):
-                    todo.append(pair)
-
-            if not cache:
-                todo = sources
-
-            if todo:
-                for source, original in todo:
-                    original_folder = [os.path.abspath(os.path.dirname(original))] if original else []
-                    compiler.compile(
-                        [source],
-                        build_dir,
-                        macros,
-                        original_folder,
+                old = state['objects'].get(obj)
+                if cache and old and old['checksum'] == compile_checksum and is_up_to_date(obj, old['deps']):
+                    new_state['objects'][obj] = old
+                    stats['objects'].append({'source': pair[0], 'object': obj, 'cache': 'up_to_date', 'seconds': 0.0})
+                else:
+                    todo.append((pair, obj))
+
+            relink = not cache or todo or state['link'] != link_checksum or not is_up_to_date(output, objects)
+
+            if relink:
+                todo_objects = [obj for pair, obj in todo]
+                todo = [pair for pair, obj in todo]
+
+                if pgo_data:
+                    copy_profile(pgo_data, module_home, todo, todo_objects)
+
+                linked = 'output-' + os.urandom(8).hex()
+                object_cache = get_cache() if shared_cache else None
+                header = None
+                keys = [None] * len(todo)
+                artifact_key = None
+
+                if pch and todo:
+                    pch_dir = os.path.join(object_cache.path if object_cache else build_dir, 'pch')
+                    with timed(stats, 'pch'):
+                        header = yield from precompiled_header(
+                            compiler,
+                            pch_dir,
+                            macros,
+                            compiler_preargs,
+                            compiler_postargs,
+                            build_log,
+                        )
+
+                if object_cache:
+                    with timed(stats, 'preprocess'):
+                        keys = yield from object_keys(
+                            compiler,
+                            todo,
+                            todo_objects,
+                            macros,
+                            header,
+                            compiler_preargs,
+                            compiler_postargs,
+                        )
+
+                    if len(todo) == len(sources) and all(keys):
+                        artifact_key = module_key(
+                            keys,
+                            compiler,
+                            libraries,
+                            library_dirs,
+                            exports,
+                            linker_preargs,
+                            linker_postargs,
+                        )
+
+                if artifact_key and cache and object_cache.get(artifact_key, os.path.join(module_home, linked)):
+                    stats['module_cache'] = 'hit'
+                    todo_deps = [
+                        read_dependencies(compiler, source, obj, b'')[0]
+                        for (source, original), obj in zip(todo, todo_objects)
+                    ]
+
+                    for (source, original), obj in zip(todo, todo_objects):
+                        stats['objects'].append({'source': source, 'object': obj, 'cache': 'module', 'seconds': 0.0})
+
+                else:
+                    stats['module_cache'] = 'miss' if artifact_key else None
+                    with timed(stats, 'compile'):
+                        todo_deps = yield from compile_objects(
+                            compiler,
+                            todo,
+                            todo_objects,
+                            keys,
+                            object_cache,
+                            cache,
+                            build_dir,
+                            macros,
+                            header,
+                            compiler_preargs,
+                            compiler_postargs,
+                            build_log,
+                            stats,
+                        )
+
+                    link = record_commands(
+                        compiler,
+                        compiler.link,
+                        'shared_object',
+                        objects,
+                        linked,
+                        module_home,
+                        libraries,
+                        [],
+                        [],
+                        exports,
                         0,
-                        compiler_preargs,
-                        compiler_postargs,
+                        linker_preargs,
+                        linker_postargs,
+                        None,
+                        'c++',
                     )
 
-                compiler.link(
-                    'shared_object',
-                    objects,
-                    'output',
-                    build_dir,
-                    libraries,
-                    [],
-                    [],
-                    exports,
-                    0,
-                    linker_preargs,
-                    linker_postargs,
-                )
+                    with timed(stats, 'link'):
+                        [(success, link_output, seconds)] = yield [link], compiler_env(compiler)
+                    build_log.write(link_output)
+                    build_log.flush()
+
+                    if not success:
+                        fail(build_log, LinkError)
+
+                    if artifact_key:
+                        object_cache.put(artifact_key, os.path.join(module_home, linked))
 
-                if os.path.isfile(output):
-                    try:
-                        os.unlink(output)
-                    except PermissionError:
-                        shutil.move(output, os.path.join(build_dir, '_' + os.urandom(8).hex()))
-                shutil.move(os.path.join(build_dir, 'output'), output)
+                for (source, original), obj, obj_deps in zip(todo, todo_objects, todo_deps):
+                    if obj_deps is not None:
+                        new_state['objects'][obj] = {
+                            'checksum': compile_checksum,
+                            'deps': obj_deps,
+                            'source': source_id(original or source, module_home),
+                        }
+
+                if object_cache:
+                    object_cache.prune()
+
+                publish(os.path.join(module_home, linked), output, build_dir)
 
         except CompileError as ex:
             raise ex from None
 
+        writeall(module_home, 'state.json', json.dumps(new_state, indent=2))
         writeall(module_home, 'args.txt', checksum)
 
-    return load_module(name, output)
+
+def build_remote(server, kwargs):
+    '''
+        Build on the server listening on the ``server`` socket, paths are sent as absolute paths.
+
+        Returns:
+            dict: The path of the built module and the build report.
+    '''
+
+    from .server import request
+
+    kwargs = {k: v for k, v in kwargs.items() if k not in ('pgo', 'report', 'server', 'load', 'pgo_data')}
+
+    for key in ('build_dir', 'output_dir'):
+        kwargs[key] = os.path.abspath(kwargs[key])
+
+    for key in ('sources', 'preprocess', 'include_dirs', 'library_dirs'):
+        if kwargs[key] is not None:
+            kwargs[key] = [os.path.abspath(x) for x in kwargs[key]]
+
+    response = request(server, {'abi': python_abi(), 'kwargs': kwargs})
+
+    if 'error' in response:
+        import builtins
+        import distutils.errors
+
+        error = getattr(distutils.errors, response['error'], None) or getattr(builtins, response['error'], None)
+        if not isinstance(error, type) or not issubclass(error, Exception):
+            error = RuntimeError
+        raise error(response['message'])
+
+    return response
+
+
+def source_id(source, module_home):
+    '''
+        Returns:
+            str: The name of a source that is the same for every build directory of the module.
+    '''
+
+    path = os.path.relpath(os.path.abspath(source), os.path.abspath(module_home))
+    return os.path.abspath(source) if path.startswith(os.pardir) else path
+
+
+def training_id(training):
+    '''
+        Returns:
+            str: A digest of the training, its code included, so a changed body is trained again.
+    '''
+
+    import marshal
+    import pickle
+
+    # functions are pickled by reference, their code is added
+    code = getattr(training, '__code__', None)
+    data = pickle.dumps(training) + (marshal.dumps(code) if code is not None else b'')
+    return hashlib.sha256(data).hexdigest()
+
+
+def copy_profile(profile, module_home, todo, todo_objects):
+    files = json.loads(readall(profile, 'profile.json'))
+    for (source, original), obj in zip(todo, todo_objects):
+        filename = files.get(source_id(original or source, module_home))
+        if filename:
+            os.makedirs(os.path.dirname(obj) or '.', exist_ok=True)
+            shutil.copyfile(os.path.join(profile, filename), os.path.splitext(obj)[0] + '.gcda')
+
+
+def is_gcc(compiler):
+    import subprocess
+
+    if compiler.compiler_type not in ('unix', 'mingw32', 'cygwin'):
+        return False
+
+    proc = subprocess.run(compiler.compiler_so[:1] + ['--version'], capture_output=True, env=compiler_env(compiler))
+    return not proc.returncode and b'clang' not in proc.stdout.lower()
+
+
+def run_training(name, path, training):
+    training(load_module(name, path))
+
+
+def pgo_steps(training, kwargs):
+    '''
+        Profile guided build. The module is built with instrumentation, ``training`` is called with it in a
+        subprocess and the module is built again with the collected profile. The profile is collected again
+        only when the instrumented module or the training function changes.
+    '''
+
+    import multiprocessing
+
+    name = kwargs['name']
+    build_dir = kwargs['build_dir']
+
+    if not is_gcc(create_compiler(build_dir)):
+        raise ValueError('pgo requires gcc')
+
+    pgo_dir = os.path.join(build_dir, 'pgo')
+    pgo_home = os.path.join(pgo_dir, 'temp', name)
+
+    path = yield from build_steps(**dict(
+        kwargs,
+        output=None,
+        output_dir=pgo_dir,
+        build_dir=pgo_dir,
+        compiler_preargs=['-fprofile-generate'] + (kwargs['compiler_preargs'] or []),
+        linker_preargs=['-fprofile-generate'] + (kwargs['linker_preargs'] or []),
+        shared_cache=False,
+        pgo=None,
+        report=None,
+        load=False,
+    ))
+
+    with open(path, 'rb') as f:
+        stamp = args_checksum(hashlib.sha256(f.read()).hexdigest(), training_id(training))
+
+    with file_lock(os.path.join(pgo_dir, 'temp', name + '.lock')):
+        old_stamp, _, digest = (readall(pgo_home, 'profile.txt') or '').partition(' ')
+        profile = os.path.join(pgo_dir, 'profiles', digest)
+
+        if old_stamp != stamp or not digest or not os.path.isfile(os.path.join(profile, 'profile.json')):
+            counters = {
+                obj['source']: os.path.splitext(filename)[0] + '.gcda'
+                for filename, obj in read_state(pgo_home)['objects'].items() if 'source' in obj
+            }
+
+            # the counters are merged with the data of the previous runs
+            for filename in counters.values():
+                if os.path.isfile(filename):
+                    os.unlink(filename)
+
+            process = multiprocessing.get_context('spawn').Process(target=run_training, args=(name, path, training))
+            process.start()
+            process.join()
+
+            if process.exitcode:
+                raise RuntimeError('pgo training failed')
+
+            content = {}
+            for source, filename in sorted(counters.items()):
+                if os.path.isfile(filename):
+                    with open(filename, 'rb') as f:
+                        content[source] = f.read()
+
+            digest = args_checksum(sorted(content.items()))[:32]
+            profile = os.path.join(pgo_dir, 'profiles', digest)
+
+            files = {}
+            os.makedirs(profile, exist_ok=True)
+            for index, source in enumerate(sorted(content)):
+                files[source] = '%d.gcda' % index
+                with open(os.path.join(profile, files[source]), 'wb') as f:
+                    f.write(content[source])
+
+            writeall(profile, 'profile.json', json.dumps(files, indent=2))
+            writeall(pgo_home, 'profile.txt', stamp + ' ' + digest)
+
+    # the generated sources live in another folder, the profile is still used when only their paths differ
+    compiler_preargs = [
+        '-fprofile-use', '-fprofile-correction', '-Wno-missing-profile', '-Wno-coverage-mismatch',
+        '-DCFLY_PGO=' + digest,
+    ]
+    return (yield from build_steps(**dict(
+        kwargs,
+        compiler_preargs=compiler_preargs + (kwargs['compiler_preargs'] or []),
+        pgo=None,
+        pgo_data=profile,
+    )))
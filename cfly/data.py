@@ -75,6 +75,7 @@ tps = [
     'tp_richcompare',
     'tp_setattro',
     'tp_traverse',
+    'tp_vectorcall',
 ]
 
 prefixes = {
@@ -86,24 +87,754 @@ prefixes = {
     'tp': None,
 }
 
-type_pattern = r'^\s*struct\s+([A-Za-z][A-Za-z0-9]*)\s*\{(\n\s*PyObject_HEAD\n(?:[^\{\}]*(?:\{(?:[^\{\}]*(?:\{(?:[^\{\}]*(?:\{[^\{\}]*\}[^\{\}]*)?)\}[^\{\}]*)?)\}[^\{\}]*)?))\};'
-proc_pattern = r'^\s*([A-Za-z_][A-Za-z0-9_]*(?:\s*\*)?)\s*([A-Za-z][A-Za-z0-9]*)_([A-Za-z_][A-Za-z0-9_]*)\s*\(([^\)]*)\)\s*\{'
+
+opt_profiles = {
+    'unix': {
+        'debug': (['-O0', '-g', '-UNDEBUG'], []),
+        'release': (['-O3', '-DNDEBUG'], []),
+        'native': (['-O3', '-DNDEBUG', '-march=native'], []),
+        'lto': (['-O3', '-DNDEBUG', '-flto'], ['-O3', '-flto']),
+    },
+    'msvc': {
+        'debug': (['/Od', '/Zi', '/UNDEBUG'], ['/DEBUG']),
+        'release': (['/O2', '/DNDEBUG'], []),
+        'native': (['/O2', '/DNDEBUG'], []),
+        'lto': (['/O2', '/DNDEBUG', '/GL'], ['/LTCG']),
+    },
+}
+
+runtime_source = '''\
+#if defined(__cplusplus) && !defined(CFLY_RUNTIME)
+#define CFLY_RUNTIME
+
+#include <string.h>
+#include <chrono>
+#include <string>
+#include <type_traits>
+#include <utility>
+#include <vector>
+#if __cplusplus >= 201703L || _MSVC_LANG >= 201703L
+#include <string_view>
+#endif
+
+#define CFLY_NOGIL
+#define CFLY_FREELIST(size)
+
+namespace cfly {
+
+template <typename T>
+struct arg;
+
+template <typename T>
+using arg_t = arg<typename std::decay<T>::type>;
+
+template <>
+struct arg<PyObject *> {
+    PyObject * value;
+    bool load(PyObject * obj) {
+        value = obj;
+        return true;
+    }
+};
+
+template <>
+struct arg<bool> {
+    bool value;
+    bool load(PyObject * obj) {
+        int result = PyObject_IsTrue(obj);
+        value = result > 0;
+        return result >= 0;
+    }
+};
+
+template <>
+struct arg<int> {
+    int value;
+    bool load(PyObject * obj) {
+        int overflow = 0;
+        long result = PyLong_AsLongAndOverflow(obj, &overflow);
+        if (overflow || (int)result != result) {
+            PyErr_SetString(PyExc_OverflowError, "Python int too large to convert to C int");
+            return false;
+        }
+        value = (int)result;
+        return result != -1 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<unsigned> {
+    unsigned value;
+    bool load(PyObject * obj) {
+        unsigned long result = PyLong_AsUnsignedLong(obj);
+        if (result == (unsigned long)-1 && PyErr_Occurred()) {
+            return false;
+        }
+        if ((unsigned)result != result) {
+            PyErr_SetString(PyExc_OverflowError, "Python int too large to convert to C unsigned int");
+            return false;
+        }
+        value = (unsigned)result;
+        return true;
+    }
+};
+
+template <>
+struct arg<long> {
+    long value;
+    bool load(PyObject * obj) {
+        value = PyLong_AsLong(obj);
+        return value != -1 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<unsigned long> {
+    unsigned long value;
+    bool load(PyObject * obj) {
+        value = PyLong_AsUnsignedLong(obj);
+        return value != (unsigned long)-1 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<long long> {
+    long long value;
+    bool load(PyObject * obj) {
+        value = PyLong_AsLongLong(obj);
+        return value != -1 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<unsigned long long> {
+    unsigned long long value;
+    bool load(PyObject * obj) {
+        value = PyLong_AsUnsignedLongLong(obj);
+        return value != (unsigned long long)-1 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<double> {
+    double value;
+    bool load(PyObject * obj) {
+        value = PyFloat_AsDouble(obj);
+        return value != -1.0 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<float> {
+    float value;
+    bool load(PyObject * obj) {
+        double result = PyFloat_AsDouble(obj);
+        value = (float)result;
+        return result != -1.0 || !PyErr_Occurred();
+    }
+};
+
+template <>
+struct arg<const char *> {
+    const char * value;
+    bool load(PyObject * obj) {
+        value = PyUnicode_AsUTF8(obj);
+        return value != 0;
+    }
+};
+
+template <>
+struct arg<std::string> {
+    std::string value;
+    bool load(PyObject * obj) {
+        Py_ssize_t size = 0;
+        const char * data = PyUnicode_AsUTF8AndSize(obj, &size);
+        if (!data) {
+            return false;
+        }
+        value.assign(data, size);
+        return true;
+    }
+};
+
+#if __cplusplus >= 201703L || _MSVC_LANG >= 201703L
+template <>
+struct arg<std::string_view> {
+    std::string_view value;
+    bool load(PyObject * obj) {
+        Py_ssize_t size = 0;
+        const char * data = PyUnicode_AsUTF8AndSize(obj, &size);
+        if (!data) {
+            return false;
+        }
+        value = std::string_view(data, size);
+        return true;
+    }
+};
+#endif
+
+template <>
+struct arg<Py_buffer> {
+    Py_buffer value;
+    bool loaded = false;
+    bool load(PyObject * obj) {
+        loaded = PyObject_GetBuffer(obj, &value, PyBUF_FULL_RO) == 0;
+        return loaded;
+    }
+    ~arg() {
+        if (loaded) {
+            PyBuffer_Release(&value);
+        }
+    }
+};
+
+template <typename T, int N = 0>
+struct buffer {
+    T * data;
+    Py_ssize_t size;
+    int ndim;
+    const Py_ssize_t * shape;
+    const Py_ssize_t * strides;
+    T & operator[](Py_ssize_t i) const {
+        return data[i];
+    }
+    T * begin() const {
+        return data;
+    }
+    T * end() const {
+        return data + size;
+    }
+};
+
+inline char format_kind(const char * format) {
+    if (!format) {
+        return 'u';
+    }
+    if (*format && strchr("@=<>!", *format)) {
+        // only the native byte order, the items are read in place
+        const unsigned short one = 1;
+        char native = *(const unsigned char *)&one ? '<' : '>';
+        if (*format != '@' && *format != '=' && *format != native && (native == '<' || *format != '!')) {
+            return 0;
+        }
+        ++format;
+    }
+    if (!format[0] || format[1]) {
+        return 0;
+    }
+    if (strchr("bhilqn", format[0])) {
+        return 'i';
+    }
+    if (strchr("BHILQNc", format[0])) {
+        return format[0] == 'c' ? 'c' : 'u';
+    }
+    if (strchr("efd", format[0])) {
+        return 'f';
+    }
+    return format[0] == '?' ? '?' : 0;
+}
+
+template <typename T>
+inline char item_kind() {
+    typedef typename std::remove_cv<T>::type U;
+    if (std::is_same<U, bool>::value) {
+        return '?';
+    }
+    if (std::is_floating_point<U>::value) {
+        return 'f';
+    }
+    if (std::is_integral<U>::value) {
+        return std::is_signed<U>::value ? 'i' : 'u';
+    }
+    return 0;
+}
+
+inline const char * kind_name(char kind) {
+    switch (kind) {
+        case 'i': return "signed integer";
+        case 'u': return "unsigned integer";
+        case 'c': return "char";
+        case 'f': return "floating point";
+        case '?': return "bool";
+    }
+    return "unknown";
+}
+
+template <typename T, int N>
+struct arg<buffer<T, N>> {
+    buffer<T, N> value;
+    Py_buffer view;
+    bool loaded = false;
+    bool load(PyObject * obj) {
+        int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (std::is_const<T>::value ? 0 : PyBUF_WRITABLE);
+        if (PyObject_GetBuffer(obj, &view, flags) < 0) {
+            return false;
+        }
+        loaded = true;
+        char expected = item_kind<T>();
+        char kind = format_kind(view.format);
+        bool bytes = sizeof(T) == 1 && expected != '?' && (kind == 'i' || kind == 'u' || kind == 'c');
+        if (view.itemsize != (Py_ssize_t)sizeof(T) || (kind != expected && !bytes)) {
+            PyErr_Format(
+                PyExc_TypeError, "expected a buffer of %zd byte %s items, got format '%s' with %zd byte items",
+                (Py_ssize_t)sizeof(T), kind_name(expected), view.format ? view.format : "B", view.itemsize
+            );
+            return false;
+        }
+        if (N && view.ndim != N) {
+            PyErr_Format(PyExc_ValueError, "expected a %d-dimensional buffer, got %d dimensions", N, view.ndim);
+            return false;
+        }
+        value.data = (T *)view.buf;
+        value.size = view.len / view.itemsize;
+        value.ndim = view.ndim;
+        value.shape = view.shape;
+        value.strides = view.strides;
+        return true;
+    }
+    ~arg() {
+        if (loaded) {
+            PyBuffer_Release(&view);
+        }
+    }
+};
+
+template <typename T>
+inline const char * format_of() {
+    typedef typename std::remove_cv<T>::type U;
+    static const char * const integers[] = {"b", "h", "i", "q", "B", "H", "I", "Q"};
+    if (std::is_same<U, bool>::value) {
+        return "?";
+    }
+    if (std::is_same<U, float>::value) {
+        return "f";
+    }
+    if (std::is_same<U, double>::value) {
+        return "d";
+    }
+    if (std::is_integral<U>::value && sizeof(U) <= 8) {
+        int index = sizeof(U) == 1 ? 0 : sizeof(U) == 2 ? 1 : sizeof(U) == 4 ? 2 : 3;
+        return integers[index + (std::is_signed<U>::value ? 0 : 4)];
+    }
+    return 0;
+}
+
+struct owner_base {
+    virtual ~owner_base() {
+    }
+};
+
+template <typename T>
+struct owner_holder : owner_base {
+    T value;
+    owner_holder(T && value) : value(std::move(value)) {
+    }
+};
+
+template <typename F>
+struct owner_release : owner_base {
+    F release;
+    owner_release(F release) : release(release) {
+    }
+    ~owner_release() {
+        release();
+    }
+};
+
+struct owner {
+    PyObject_HEAD
+    owner_base * holder;
+    void * buf;
+    Py_ssize_t shape;
+    Py_ssize_t itemsize;
+    const char * format;
+    int readonly;
+};
+
+inline int owner_getbuffer(owner * self, Py_buffer * view, int flags) {
+    if ((flags & PyBUF_WRITABLE) && self->readonly) {
+        PyErr_SetString(PyExc_BufferError, "the buffer is read-only");
+        view->obj = 0;
+        return -1;
+    }
+    Py_INCREF(self);
+    view->obj = (PyObject *)self;
+    view->buf = self->buf;
+    view->len = self->shape * self->itemsize;
+    view->readonly = self->readonly;
+    view->itemsize = self->itemsize;
+    view->format = (flags & PyBUF_FORMAT) ? (char *)self->format : 0;
+    view->ndim = 1;
+    view->shape = (flags & PyBUF_ND) ? &self->shape : 0;
+    view->strides = (flags & PyBUF_STRIDES) ? &self->itemsize : 0;
+    view->suboffsets = 0;
+    view->internal = 0;
+    return 0;
+}
+
+inline void owner_dealloc(owner * self) {
+    delete self->holder;
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+inline PyTypeObject * owner_type() {
+    static PyTypeObject type = {PyVarObject_HEAD_INIT(0, 0)};
+    static PyBufferProcs procs = {(getbufferproc)owner_getbuffer, 0};
+    static bool ready = false;
+    if (!ready) {
+        type.tp_name = "cfly.owner";
+        type.tp_basicsize = sizeof(owner);
+        type.tp_dealloc = (destructor)owner_dealloc;
+        type.tp_as_buffer = &procs;
+        type.tp_flags = Py_TPFLAGS_DEFAULT;
+        if (PyType_Ready(&type) < 0) {
+            return 0;
+        }
+        ready = true;
+    }
+    return &type;
+}
+
+inline PyObject * memoryview(
+        owner_base * holder, void * buf, Py_ssize_t count, Py_ssize_t itemsize, const char * format, bool readonly) {
+    PyTypeObject * type = owner_type();
+    owner * self = type ? PyObject_New(owner, type) : 0;
+    if (!self) {
+        delete holder;
+        return 0;
+    }
+    if (!format) {
+        count *= itemsize;
+        itemsize = 1;
+        format = "B";
+    }
+    self->holder = holder;
+    self->buf = buf;
+    self->shape = count;
+    self->itemsize = itemsize;
+    self->format = format;
+    self->readonly = readonly;
+    PyObject * result = PyMemoryView_FromObject((PyObject *)self);
+    Py_DECREF(self);
+    return result;
+}
+
+// items without a buffer format are exposed as raw bytes, they must not hold pointers or owned memory
+template <typename T>
+struct plain_item {
+    typedef typename std::remove_cv<T>::type U;
+    static const bool value = std::is_arithmetic<U>::value || (
+        std::is_trivially_copyable<U>::value && !std::is_pointer<U>::value && !std::is_member_pointer<U>::value
+    );
+};
+
+template <typename C>
+inline PyObject * memoryview(C && container, bool readonly = false) {
+    typedef typename std::decay<C>::type D;
+    typedef typename std::remove_pointer<decltype(container.data())>::type T;
+    static_assert(!std::is_lvalue_reference<C>::value, "cfly::memoryview takes the container, use std::move");
+    static_assert(plain_item<T>::value, "cfly::memoryview requires arithmetic or trivially copyable items");
+    owner_holder<D> * holder = new owner_holder<D>(std::move(container));
+    void * buf = (void *)holder->value.data();
+    return memoryview(holder, buf, holder->value.size(), sizeof(T), format_of<T>(), readonly);
+}
+
+template <typename T, typename F>
+inline PyObject * memoryview(T * data, Py_ssize_t count, F release, bool readonly = std::is_const<T>::value) {
+    static_assert(plain_item<T>::value, "cfly::memoryview requires arithmetic or trivially copyable items");
+    return memoryview(new owner_release<F>(release), (void *)data, count, sizeof(T), format_of<T>(), readonly);
+}
+
+template <typename T>
+inline PyObject * box(std::vector<T> && value) {
+    return memoryview(std::move(value));
+}
+
+struct gil_release {
+    PyThreadState * state;
+    gil_release() : state(PyEval_SaveThread()) {
+    }
+    ~gil_release() {
+        PyEval_RestoreThread(state);
+    }
+};
+
+template <typename F>
+inline auto nogil(F func) -> decltype(func()) {
+    gil_release release;
+    return func();
+}
+
+struct freelist {
+    PyObject ** items;
+    int size;
+    int count;
+    unsigned long long hits;
+    unsigned long long misses;
+};
+
+inline PyObject * freelist_alloc(freelist * pool, PyTypeObject * exact, PyTypeObject * type, Py_ssize_t nitems) {
+    if (type == exact && pool->count) {
+        PyObject * obj = pool->items[--pool->count];
+        memset(obj, 0, type->tp_basicsize);
+        pool->hits += 1;
+        return PyObject_Init(obj, type);
+    }
+    pool->misses += 1;
+    return PyType_GenericAlloc(type, nitems);
+}
+
+inline void freelist_free(freelist * pool, PyTypeObject * exact, void * obj) {
+    if (Py_TYPE((PyObject *)obj) == exact && pool->count < pool->size) {
+        pool->items[pool->count++] = (PyObject *)obj;
+        return;
+    }
+    PyObject_Free(obj);
+}
+
+inline PyObject * freelist_stats(freelist * pool) {
+    return Py_BuildValue(
+        "{sisisKsK}", "size", pool->size, "count", pool->count, "hits", pool->hits, "misses", pool->misses
+    );
+}
+
+struct counter;
+
+inline counter *& counters() {
+    static counter * head = 0;
+    return head;
+}
+
+struct counter {
+    const char * name;
+    unsigned long long calls;
+    unsigned long long ns;
+    counter * next;
+    counter(const char * name) : name(name), calls(0), ns(0), next(counters()) {
+        counters() = this;
+    }
+};
+
+struct timer {
+    counter & target;
+    std::chrono::steady_clock::time_point start;
+    timer(counter & target) : target(target), start(std::chrono::steady_clock::now()) {
+    }
+    ~timer() {
+        target.calls += 1;
+        target.ns += std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now() - start).count();
+    }
+};
+
+template <typename T, T F, counter * C>
+struct profiled;
+
+template <typename R, typename... A, R (*F)(A...), counter * C>
+struct profiled<R (*)(A...), F, C> {
+    static R call(A... args) {
+        timer measure(*C);
+        return F(args...);
+    }
+};
+
+inline PyObject * stats(bool reset) {
+    PyObject * result = PyDict_New();
+    for (counter * item = counters(); result && item; item = item->next) {
+        PyObject * value = Py_BuildValue("{sKsK}", "calls", item->calls, "ns", item->ns);
+        if (!value || PyDict_SetItemString(result, item->name, value) < 0) {
+            Py_XDECREF(value);
+            Py_DECREF(result);
+            return 0;
+        }
+        Py_DECREF(value);
+        if (reset) {
+            item->calls = 0;
+            item->ns = 0;
+        }
+    }
+    return result;
+}
+
+inline PyObject * box(PyObject * value) {
+    return value;
+}
+
+inline PyObject * box(bool value) {
+    return PyBool_FromLong(value);
+}
+
+inline PyObject * box(int value) {
+    return PyLong_FromLong(value);
+}
+
+inline PyObject * box(unsigned value) {
+    return PyLong_FromUnsignedLong(value);
+}
+
+inline PyObject * box(long value) {
+    return PyLong_FromLong(value);
+}
+
+inline PyObject * box(unsigned long value) {
+    return PyLong_FromUnsignedLong(value);
+}
+
+inline PyObject * box(long long value) {
+    return PyLong_FromLongLong(value);
+}
+
+inline PyObject * box(unsigned long long value) {
+    return PyLong_FromUnsignedLongLong(value);
+}
+
+inline PyObject * box(double value) {
+    return PyFloat_FromDouble(value);
+}
+
+inline PyObject * box(const char * value) {
+    return PyUnicode_FromString(value);
+}
+
+inline PyObject * box(const std::string & value) {
+    return PyUnicode_FromStringAndSize(value.data(), value.size());
+}
+
+#if __cplusplus >= 201703L || _MSVC_LANG >= 201703L
+inline PyObject * box(std::string_view value) {
+    return PyUnicode_FromStringAndSize(value.data(), value.size());
+}
+#endif
+
+inline bool unpack(
+        const char * name, PyObject * const * args, Py_ssize_t nargs, PyObject * kwnames,
+        const char * const * names, Py_ssize_t count, Py_ssize_t required, PyObject ** values) {
+    if (nargs > count) {
+        PyErr_Format(PyExc_TypeError, "%s() takes %zd positional arguments but %zd were given", name, count, nargs);
+        return false;
+    }
+    for (Py_ssize_t i = 0; i < nargs; ++i) {
+        values[i] = args[i];
+    }
+    Py_ssize_t keywords = kwnames ? PyTuple_GET_SIZE(kwnames) : 0;
+    for (Py_ssize_t k = 0; k < keywords; ++k) {
+        PyObject * keyword = PyTuple_GET_ITEM(kwnames, k);
+        Py_ssize_t i = 0;
+        while (i < count && PyUnicode_CompareWithASCIIString(keyword, names[i])) {
+            ++i;
+        }
+        if (i == count) {
+            PyErr_Format(PyExc_TypeError, "%s() got an unexpected keyword argument '%U'", name, keyword);
+            return false;
+        }
+        if (values[i]) {
+            PyErr_Format(PyExc_TypeError, "%s() got multiple values for argument '%s'", name, names[i]);
+            return false;
+        }
+        values[i] = args[nargs + k];
+    }
+    for (Py_ssize_t i = 0; i < required; ++i) {
+        if (!values[i]) {
+            PyErr_Format(PyExc_TypeError, "%s() missing required argument '%s'", name, names[i]);
+            return false;
+        }
+    }
+    return true;
+}
+
+}
+
+#endif
+'''
+
+pch_source = '''\
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+''' + runtime_source
 
 source_template = '''\
 //!
 #include <Python.h>
+#include <stddef.h>
 //!
+#if PY_VERSION_HEX >= 0x03080000 && !defined(Py_TPFLAGS_HAVE_VECTORCALL)
+#define Py_TPFLAGS_HAVE_VECTORCALL _Py_TPFLAGS_HAVE_VECTORCALL
+#endif
+//!
+/// macro typed(meth, function, qualname)
+PyObject * __cfly_/*{function}*/(PyObject * self, PyObject * const * args, Py_ssize_t nargs, PyObject * kwnames) {
+/// if meth.params
+    static const char * const names[] = {/*% for param in meth.params %*/"/*{param.name}*/", /*% endfor %*/0};
+    PyObject * values[/*{meth.params|length}*/] = {};
+    if (!cfly::unpack("/*{qualname}*/", args, nargs, kwnames, names, /*{meth.params|length}*/, /*{meth.required}*/, values)) {
+        return 0;
+    }
+/// for param in meth.params
+    cfly::arg_t</*{param.type}*/> arg/*{loop.index0}*/;
+/// if param.default is not none
+    if (!values[/*{loop.index0}*/]) {
+        arg/*{loop.index0}*/.value = /*{param.default}*/;
+    } else if (!arg/*{loop.index0}*/.load(values[/*{loop.index0}*/])) {
+        return 0;
+    }
+/// else
+    if (!arg/*{loop.index0}*/.load(values[/*{loop.index0}*/])) {
+        return 0;
+    }
+/// endif
+/// endfor
+/// else
+    if (!cfly::unpack("/*{qualname}*/", args, nargs, kwnames, 0, 0, 0, 0)) {
+        return 0;
+    }
+/// endif
+/// if meth.void and meth.nogil
+    cfly::nogil([&]() {
+        /*{function}*/(/*{meth.call_args}*/);
+    });
+    Py_RETURN_NONE;
+/// elif meth.void
+    /*{function}*/(/*{meth.call_args}*/);
+    Py_RETURN_NONE;
+/// elif meth.nogil
+    return cfly::box(cfly::nogil([&]() {
+        return /*{function}*/(/*{meth.call_args}*/);
+    }));
+/// else
+    return cfly::box(/*{function}*/(/*{meth.call_args}*/));
+/// endif
+}
+/// endmacro
+/// if counters
+/// for function, label in counters
+cfly::counter __cfly_counter_/*{function}*/("/*{label}*/");
+/// endfor
+//!
+/// endif
 /// if methods
 /// for meth in methods.values()
-PyCFunction __meth_/*{meth.name}*/ = (PyCFunction)meth_/*{meth.name}*/;
+/// if meth.typed
+/*{ typed(meth, 'meth_' + meth.name, meth.name) }*/
+PyCFunction __meth_/*{meth.name}*/ = (PyCFunction)/*{ wrap('__cfly_meth_' + meth.name) }*/;
+/// else
+PyCFunction __meth_/*{meth.name}*/ = (PyCFunction)/*{ wrap('meth_' + meth.name) }*/;
+/// endif
 /// endfor
 //!
 /// endif
 /// for typ in types.values()
 /// if typ.tp_methods
+/// for meth in typ.methods.values()
+/// if meth.typed
+/*{ typed(meth, typ.name + '_meth_' + meth.name, meth.name) }*/
+/// endif
+/// endfor
 PyMethodDef /*{typ.name}*/_tp_methods[] = {
 /// for meth in typ.methods.values()
-    {"/*{meth.name}*/", (PyCFunction)/*{typ.name}*/_meth_/*{meth.name}*/, /*{meth.flags}*/, "/*{module}*/./*{typ.name}*/./*{meth.name}*/"},
+/// if meth.typed
+    {"/*{meth.name}*/", (PyCFunction)/*{ wrap('__cfly_' + typ.name + '_meth_' + meth.name) }*/, /*{meth.flags}*/, "/*{module}*/./*{typ.name}*/./*{meth.name}*/"},
+/// else
+    {"/*{meth.name}*/", (PyCFunction)/*{ wrap(typ.name + '_meth_' + meth.name) }*/, /*{meth.flags}*/, "/*{module}*/./*{typ.name}*/./*{meth.name}*/"},
+/// endif
 /// endfor
     {0, 0, 0, 0},
 };
@@ -112,7 +843,7 @@ PyMethodDef /*{typ.name}*/_tp_methods[] = {
 /// if typ.tp_getset
 PyGetSetDef /*{typ.name}*/_tp_getset[] = {
 /// for getset in typ.getset.values()
-    {"/*{getset.name}*/", (getter)/*{ getset.get.name or 0 }*/, (setter)/*{ getset.set.name or 0 }*/, "/*{module}*/./*{typ.name}*/./*{getset.name}*/", 0},
+    {"/*{getset.name}*/", (getter)/*{ wrap(getset.get) or 0 }*/, (setter)/*{ wrap(getset.set) or 0 }*/, "/*{module}*/./*{typ.name}*/./*{getset.name}*/", 0},
 /// endfor
     {0, 0, 0, 0, 0},
 };
@@ -120,111 +851,141 @@ PyGetSetDef /*{typ.name}*/_tp_getset[] = {
 /// endif
 /// if typ.tp_as_number
 PyNumberMethods /*{typ.name}*/_tp_as_number = {
-    (binaryfunc)/*{ typ.nb_add or 0 }*/,
-    (binaryfunc)/*{ typ.nb_subtract or 0 }*/,
-    (binaryfunc)/*{ typ.nb_multiply or 0 }*/,
-    (binaryfunc)/*{ typ.nb_remainder or 0 }*/,
-    (binaryfunc)/*{ typ.nb_divmod or 0 }*/,
-    (ternaryfunc)/*{ typ.nb_power or 0 }*/,
-    (unaryfunc)/*{ typ.nb_negative or 0 }*/,
-    (unaryfunc)/*{ typ.nb_positive or 0 }*/,
-    (unaryfunc)/*{ typ.nb_absolute or 0 }*/,
-    (inquiry)/*{ typ.nb_bool or 0 }*/,
-    (unaryfunc)/*{ typ.nb_invert or 0 }*/,
-    (binaryfunc)/*{ typ.nb_lshift or 0 }*/,
-    (binaryfunc)/*{ typ.nb_rshift or 0 }*/,
-    (binaryfunc)/*{ typ.nb_and or 0 }*/,
-    (binaryfunc)/*{ typ.nb_xor or 0 }*/,
-    (binaryfunc)/*{ typ.nb_or or 0 }*/,
-    (unaryfunc)/*{ typ.nb_int or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_add) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_subtract) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_multiply) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_remainder) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_divmod) or 0 }*/,
+    (ternaryfunc)/*{ wrap(typ.nb_power) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_negative) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_positive) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_absolute) or 0 }*/,
+    (inquiry)/*{ wrap(typ.nb_bool) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_invert) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_lshift) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_rshift) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_and) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_xor) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_or) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_int) or 0 }*/,
     0,
-    (unaryfunc)/*{ typ.nb_float or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_add or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_subtract or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_multiply or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_remainder or 0 }*/,
-    (ternaryfunc)/*{ typ.nb_inplace_power or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_lshift or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_rshift or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_and or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_xor or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_or or 0 }*/,
-    (binaryfunc)/*{ typ.nb_floor_divide or 0 }*/,
-    (binaryfunc)/*{ typ.nb_true_divide or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_floor_divide or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_true_divide or 0 }*/,
-    (unaryfunc)/*{ typ.nb_index or 0 }*/,
-    (binaryfunc)/*{ typ.nb_matrix_multiply or 0 }*/,
-    (binaryfunc)/*{ typ.nb_inplace_matrix_multiply or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_float) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_add) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_subtract) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_multiply) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_remainder) or 0 }*/,
+    (ternaryfunc)/*{ wrap(typ.nb_inplace_power) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_lshift) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_rshift) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_and) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_xor) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_or) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_floor_divide) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_true_divide) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_floor_divide) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_true_divide) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.nb_index) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_matrix_multiply) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.nb_inplace_matrix_multiply) or 0 }*/,
 };
 //!
 /// endif
 /// if typ.tp_as_sequence
 PySequenceMethods /*{typ.name}*/_tp_as_sequence = {
-    (lenfunc)/*{ typ.sq_length or 0 }*/,
-    (binaryfunc)/*{ typ.sq_concat or 0 }*/,
-    (ssizeargfunc)/*{ typ.sq_repeat or 0 }*/,
-    (ssizeargfunc)/*{ typ.sq_item or 0 }*/,
+    (lenfunc)/*{ wrap(typ.sq_length) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.sq_concat) or 0 }*/,
+    (ssizeargfunc)/*{ wrap(typ.sq_repeat) or 0 }*/,
+    (ssizeargfunc)/*{ wrap(typ.sq_item) or 0 }*/,
     0,
-    (ssizeobjargproc)/*{ typ.sq_ass_item or 0 }*/,
+    (ssizeobjargproc)/*{ wrap(typ.sq_ass_item) or 0 }*/,
     0,
-    (objobjproc)/*{ typ.sq_contains or 0 }*/,
-    (binaryfunc)/*{ typ.sq_inplace_concat or 0 }*/,
-    (ssizeargfunc)/*{ typ.sq_inplace_repeat or 0 }*/,
+    (objobjproc)/*{ wrap(typ.sq_contains) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.sq_inplace_concat) or 0 }*/,
+    (ssizeargfunc)/*{ wrap(typ.sq_inplace_repeat) or 0 }*/,
 };
 //!
 /// endif
 /// if typ.tp_as_mapping
 PyMappingMethods /*{typ.name}*/_tp_as_mapping = {
-    (lenfunc)/*{ typ.mp_length or 0 }*/,
-    (binaryfunc)/*{ typ.mp_subscript or 0 }*/,
-    (objobjargproc)/*{ typ.mp_ass_subscript or 0 }*/,
+    (lenfunc)/*{ wrap(typ.mp_length) or 0 }*/,
+    (binaryfunc)/*{ wrap(typ.mp_subscript) or 0 }*/,
+    (objobjargproc)/*{ wrap(typ.mp_ass_subscript) or 0 }*/,
 };
 //!
 /// endif
 /// if typ.tp_as_async
 PyAsyncMethods /*{typ.name}*/_tp_as_async = {
-    (unaryfunc)/*{ typ.am_await or 0 }*/,
-    (unaryfunc)/*{ typ.am_aiter or 0 }*/,
-    (unaryfunc)/*{ typ.am_anext or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.am_await) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.am_aiter) or 0 }*/,
+    (unaryfunc)/*{ wrap(typ.am_anext) or 0 }*/,
 };
 //!
 /// endif
 /// if typ.tp_as_buffer
 PyBufferProcs /*{typ.name}*/_tp_as_buffer = {
-    (getbufferproc)/*{ typ.bf_getbuffer or 0 }*/,
-    (releasebufferproc)/*{ typ.bf_releasebuffer or 0 }*/,
+    (getbufferproc)/*{ wrap(typ.bf_getbuffer) or 0 }*/,
+    (releasebufferproc)/*{ wrap(typ.bf_releasebuffer) or 0 }*/,
 };
 //!
 /// endif
+/// if typ.freelist
+extern PyTypeObject /*{typ.name}*/_Type;
+PyObject * /*{typ.name}*/_freelist_items[/*{typ.freelist}*/];
+cfly::freelist /*{typ.name}*/_freelist = {/*{typ.name}*/_freelist_items, /*{typ.freelist}*/, 0, 0, 0};
+//!
+PyObject * /*{typ.name}*/_freelist_alloc(PyTypeObject * type, Py_ssize_t nitems) {
+    return cfly::freelist_alloc(&/*{typ.name}*/_freelist, &/*{typ.name}*/_Type, type, nitems);
+}
+//!
+void /*{typ.name}*/_freelist_free(void * obj) {
+    cfly::freelist_free(&/*{typ.name}*/_freelist, &/*{typ.name}*/_Type, obj);
+}
+//!
+PyObject * /*{typ.name}*/_freelist_stats() {
+    return cfly::freelist_stats(&/*{typ.name}*/_freelist);
+}
+//!
+/// endif
 PyTypeObject /*{typ.name}*/_Type = {
     PyVarObject_HEAD_INIT(0, 0)
     "/*{module}*/./*{typ.name}*/",
     sizeof(/*{typ.name}*/),
     0,
-    (destructor)/*{ typ.tp_dealloc or 0 }*/,
+    (destructor)/*{ wrap(typ.tp_dealloc) or 0 }*/,
+/// if typ.vectorcall
+    offsetof(/*{typ.name}*/, vectorcall),
+/// else
     0,
+/// endif
     0,
     0,
     /*{ typ.tp_as_async or 0 }*/,
-    (reprfunc)/*{ typ.tp_repr or 0 }*/,
+    (reprfunc)/*{ wrap(typ.tp_repr) or 0 }*/,
     /*{ typ.tp_as_number or 0 }*/,
     /*{ typ.tp_as_sequence or 0 }*/,
     /*{ typ.tp_as_mapping or 0 }*/,
-    (hashfunc)/*{ typ.tp_hash or 0 }*/,
-    (ternaryfunc)/*{ typ.tp_call or 0 }*/,
-    (reprfunc)/*{ typ.tp_reprfunc or 0 }*/,
-    (getattrofunc)/*{ typ.tp_getattro or 0 }*/,
-    (setattrofunc)/*{ typ.tp_setattro or 0 }*/,
+    (hashfunc)/*{ wrap(typ.tp_hash) or 0 }*/,
+/// if typ.vectorcall
+    (ternaryfunc)/*{ wrap(typ.tp_call) or 'PyVectorcall_Call' }*/,
+/// else
+    (ternaryfunc)/*{ wrap(typ.tp_call) or 0 }*/,
+/// endif
+    (reprfunc)/*{ wrap(typ.tp_reprfunc) or 0 }*/,
+    (getattrofunc)/*{ wrap(typ.tp_getattro) or 0 }*/,
+    (setattrofunc)/*{ wrap(typ.tp_setattro) or 0 }*/,
     /*{ typ.tp_as_buffer or 0 }*/,
+/// if typ.vectorcall
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_VECTORCALL,
+/// else
     Py_TPFLAGS_DEFAULT,
+/// endif
     "/*{module}*/./*{typ.name}*/",
-    (traverseproc)/*{ typ.tp_traverse or 0 }*/,
-    (inquiry)/*{ typ.tp_clear or 0 }*/,
-    (richcmpfunc)/*{ typ.tp_richcompare or 0 }*/,
+    (traverseproc)/*{ wrap(typ.tp_traverse) or 0 }*/,
+    (inquiry)/*{ wrap(typ.tp_clear) or 0 }*/,
+    (richcmpfunc)/*{ wrap(typ.tp_richcompare) or 0 }*/,
     0,
-    (getiterfunc)/*{ typ.tp_iter or 0 }*/,
-    (iternextfunc)/*{ typ.tp_iternext or 0 }*/,
+    (getiterfunc)/*{ wrap(typ.tp_iter) or 0 }*/,
+    (iternextfunc)/*{ wrap(typ.tp_iternext) or 0 }*/,
     /*{ typ.tp_methods or 0 }*/,
     0,
     /*{ typ.tp_getset or 0 }*/,
@@ -233,19 +994,24 @@ PyTypeObject /*{typ.name}*/_Type = {
     0,
     0,
     0,
-    (initproc)/*{ typ.tp_init or 0 }*/,
-    (allocfunc)/*{ typ.tp_alloc or 0 }*/,
-    (newfunc)/*{ typ.tp_new or 0 }*/,
-    (freefunc)/*{ typ.tp_free or 0 }*/,
+    (initproc)/*{ wrap(typ.tp_init) or 0 }*/,
+    (allocfunc)/*{ wrap(typ.tp_alloc) or (typ.freelist and typ.name + '_freelist_alloc') or 0 }*/,
+    (newfunc)/*{ wrap(typ.tp_new) or 0 }*/,
+    (freefunc)/*{ wrap(typ.tp_free) or (typ.freelist and typ.name + '_freelist_free') or 0 }*/,
     0,
     0,
     0,
     0,
     0,
     0,
-    (destructor)/*{ typ.tp_del or 0 }*/,
+    (destructor)/*{ wrap(typ.tp_del) or 0 }*/,
     0,
     0,
+/// if typ.tp_vectorcall
+#if PY_VERSION_HEX >= 0x03080000
+    (vectorcallfunc)/*{ wrap(typ.tp_vectorcall) }*/,
+#endif
+/// endif
 };
 //!
 /// endfor
@@ -267,10 +1033,48 @@ extern PyCFunction __meth_/*{meth.name}*/;
 /// endfor
 //!
 /// endif
+/// set freelists = types.values()|selectattr('freelist')|list
+/// if freelists
+/// for typ in freelists
+PyObject * /*{typ.name}*/_freelist_stats();
+/// endfor
+//!
+PyObject * __cfly_freelists__(PyObject * self) {
+    PyObject * result = PyDict_New();
+/// for typ in freelists
+    PyObject * /*{typ.name}*/_stats = /*{typ.name}*/_freelist_stats();
+    if (!result || !/*{typ.name}*/_stats || PyDict_SetItemString(result, "/*{typ.name}*/", /*{typ.name}*/_stats) < 0) {
+        Py_XDECREF(/*{typ.name}*/_stats);
+        Py_XDECREF(result);
+        return 0;
+    }
+    Py_DECREF(/*{typ.name}*/_stats);
+/// endfor
+    return result;
+}
+//!
+/// endif
+/// if profile
+PyObject * __cfly_stats__(PyObject * self, PyObject * args, PyObject * kwargs) {
+    static const char * keywords[] = {"reset", 0};
+    int reset = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|p", (char **)keywords, &reset)) {
+        return 0;
+    }
+    return cfly::stats(reset);
+}
+//!
+/// endif
 PyMethodDef module_methods[] = {
 /// for meth in methods.values()
     {"/*{meth.name}*/", __meth_/*{meth.name}*/, /*{meth.flags}*/, 0},
 /// endfor
+/// if freelists
+    {"__cfly_freelists__", (PyCFunction)__cfly_freelists__, METH_NOARGS, 0},
+/// endif
+/// if profile
+    {"__cfly_stats__", (PyCFunction)__cfly_stats__, METH_VARARGS | METH_KEYWORDS, 0},
+/// endif
     {0, 0, 0, 0},
 };
 //!
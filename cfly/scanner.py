@@ -0,0 +1,248 @@
+'''
+    Single pass scanner for the declarations ``parse_source`` cares about.
+
+    Comments, string literals and preprocessor directives are skipped, braces are matched at any depth
+    and only definitions at file scope are reported, including the ones in ``extern "C" { ... }`` blocks.
+'''
+
+import functools
+import itertools
+import re
+import sys
+
+literals = r'''
+      (?P<directive>\#(?:\\.|[^\n\\])*)
+    | (?P<string>(?:u8|[uUL])?R"(?P<delim>[^()\\\s]{0,16})\(.*?\)(?P=delim)"|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+'''
+
+comment = r'//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/'
+space = r'(?:\s|' + comment + ')'
+qualifier = r'(?:CFLY_NOGIL|const|signed|unsigned|short|long)'
+atomic_names = itertools.count()
+
+
+def atomic(pattern):
+    '''
+        ``(?>pattern)``, what the group matched is never given back. Before Python 3.11 it is written
+        as a lookahead with a backreference.
+    '''
+
+    if sys.version_info >= (3, 11):
+        return '(?>' + pattern + ')'
+
+    name = 'atomic%d' % next(atomic_names)
+    return '(?=(?P<%s>%s))(?P=%s)' % (name, pattern, name)
+
+
+def spaces(minimum=0):
+    return atomic(space + ('+' if minimum else '*'))
+
+
+def nested_group(depth):
+    '''
+        A pattern for the rest of a brace group nested at most ``depth`` levels deep, matched at once.
+        Every alternative starts with its own character, so deeper groups fail without backtracking.
+    '''
+
+    plain = r'''[^{}"'/\#R]*'''
+    atoms = r'''
+        /(?![/*]) | R(?!") | //[^\n]*(?![^\n]) | /\*[^*]*\*+(?:[^/*][^*]*\*+)*/
+        | \#(?:\\.|[^\n\\])*(?![^\n]) | "(?:\\.|[^"\\\n])*" | '(?:\\.|[^'\\\n])*'
+    '''
+
+    body = plain + '(?:(?:' + atoms + ')' + plain + ')*'
+    for _ in range(depth):
+        body = plain + '(?:(?:' + atoms + r'| \{' + body + r'\})' + plain + ')*'
+
+    return body + r'\}'
+
+
+def group_pattern(opening, closing):
+    symbols = {'opening': re.escape(opening), 'closing': re.escape(closing)}
+    return re.compile(r'''
+        (?:[^"'/\#R%(opening)s%(closing)s]+|/(?![/*])|R(?!")|''' % symbols + comment + r''')*
+        (?:''' + literals + r'''
+        | (?P<op>.)
+        | (?P<end>\Z)
+        )
+    ''', re.S | re.X)
+
+
+@functools.lru_cache(maxsize=None)
+def patterns():
+    '''
+        The patterns are compiled on the first scan, not when cfly is imported.
+
+        Returns:
+            tuple: The token pattern and the ``(opening, closing, pattern, nested)`` arguments of ``skip_group``
+            by the character opening the group.
+    '''
+
+    nested = nested_group(3)
+
+    # the runs of spaces and comments are atomic, a failed match does not try every way to split them
+    token_pattern = re.compile(spaces() + r'''
+        (?:
+          (?P<struct>struct''' + spaces(1) + r'''(?P<type>[A-Za-z][A-Za-z0-9]*)\b''' + spaces() + r'''\{
+            (?P<struct_body>''' + nested + r''')?)
+        | (?P<proc>(?P<rval>(?:''' + qualifier + spaces(1) + r''')*[A-Za-z_]\w*
+            (?:::[A-Za-z_]\w*)*\b(?:\s*<[\w\s:,*&<>]*>)?(?:''' + spaces() + r'''[*&])?)''' + spaces() + r'''
+            (?:(?P<proc_type>[A-Za-z][A-Za-z0-9]*)_(?P<proc_member>[A-Za-z_][A-Za-z0-9_]*)\b|[A-Za-z_]\w*\b)
+            (?=''' + spaces() + r'''\()
+            (?:''' + spaces() + r'''\((?P<proc_args>[^()"'/\#]*)\)(?:(?P<proc_open>''' + spaces() + r'''\{)
+            (?P<proc_body>''' + nested + r''')?)?)?)
+        | (?P<linkage>extern''' + spaces() + r'''"C(?:\+\+)?"(?P<linkage_open>''' + spaces() + r'''\{)?)
+        | ''' + literals + r'''
+        | (?P<name>(?:''' + qualifier + spaces(1) + r''')*[A-Za-z_]\w*)
+        | (?P<number>\.?\d(?:[eEpP][+-]|'?[\w.])*)
+        | (?P<op>.)
+        | (?P<end>\Z)
+        )
+    ''', re.S | re.X)
+
+    group_patterns = {
+        '{': ('{', '}', group_pattern('{', '}'), re.compile(nested, re.S | re.X)),
+        '(': ('(', ')', group_pattern('(', ')'), None),
+    }
+
+    return token_pattern, group_patterns
+
+
+type_body_pattern = re.compile(r'\n\s*PyObject_HEAD\n')
+type_end_pattern = re.compile(r'\s*;')
+
+
+def skip_group(source, pos, opening, closing, pattern, nested):
+    '''
+        Returns:
+            int: The position after the character closing the group opened before ``pos``.
+    '''
+
+    if nested:
+        match = nested.match(source, pos)
+        if match:
+            return match.end()
+
+    depth = 1
+
+    while True:
+        match = pattern.match(source, pos)
+        kind = match.lastgroup
+        pos = match.end()
+
+        if kind == 'end':
+            return pos
+
+        if kind == 'op':
+            text = match.group(kind)
+            if text == opening:
+                depth += 1
+
+            elif text == closing:
+                depth -= 1
+                if not depth:
+                    return pos
+
+
+def scan(source):
+    '''
+        Find the extension types and functions defined at file scope.
+
+        Args:
+            source (str): The C++ source.
+
+        Returns:
+            tuple: ``(name, struct)`` pairs for the structs starting with ``PyObject_HEAD``
+            and ``(rval, type, name, args)`` tuples for the functions named ``type_name``.
+    '''
+
+    token_pattern, group_patterns = patterns()
+    types = []
+    procs = []
+    declaration = []
+    linkage_blocks = 0
+    pos = 0
+
+    while True:
+        match = token_pattern.match(source, pos)
+        kind = match.lastgroup
+        pos = match.end()
+
+        if kind == 'end':
+            break
+
+        if kind == 'directive':
+            continue
+
+        body = None
+
+        if kind == 'linkage':
+            if match.group('linkage_open') is None:
+                declaration = [(kind, match)]
+            else:
+                linkage_blocks += 1
+                declaration = []
+            continue
+
+        # structs and functions are usually matched with their body
+        if kind == 'struct':
+            declaration.append((kind, match))
+            text = '{'
+            body = match.group('struct_body')
+
+        elif kind == 'proc' and match.group('proc_args') is not None:
+            args, opening, body = match.group('proc_args', 'proc_open', 'proc_body')
+            declaration += [(kind, match), ('args', args)]
+            if opening is None:
+                continue
+            text = '{'
+
+        else:
+            text = match.group(kind)
+
+            if text == ';':
+                declaration = []
+                continue
+
+            # the closing brace of an extern "C" block
+            if text == '}' and linkage_blocks:
+                linkage_blocks -= 1
+                declaration = []
+                continue
+
+            if text not in group_patterns:
+                declaration.append((kind, match))
+                continue
+
+        if declaration and declaration[0][0] == 'linkage':
+            declaration = declaration[1:]
+
+        shape = [kind for kind, value in declaration]
+
+        # parentheses and braces are skipped as a whole
+        if body is None:
+            start = pos
+            pos = skip_group(source, pos, *group_patterns[text])
+            content = source[start:pos - 1]
+
+        else:
+            content = body[:-1]
+
+        if text == '(':
+            declaration.append(('args', content))
+            continue
+
+        if shape == ['struct']:
+            struct = content
+            if type_body_pattern.match(struct) and type_end_pattern.match(source, pos):
+                types.append((declaration[0][1].group('type'), struct))
+
+        elif shape == ['proc', 'args']:
+            (_, head), (_, args) = declaration
+            rval, typ, name = head.group('rval', 'proc_type', 'proc_member')
+            if typ:
+                procs.append((rval, typ, name, args))
+
+        declaration = []
+
+    return types, procs
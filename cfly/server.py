@@ -0,0 +1,208 @@
+'''
+    A long-lived build server. It keeps the compiler configuration and one worker pool for every client,
+    builds requested concurrently by many processes share the same compiler jobs and identical requests
+    are built once.
+
+    usage: python -m cfly.server [--socket PATH] [--jobs N]
+
+    Clients use the server when ``CFLY_SERVER`` or the ``server`` argument of :func:`cfly.build_module`
+    is the path of its socket.
+'''
+
+import json
+import os
+import stat
+import sys
+
+from .cache import python_abi
+from .core import build_steps, run_commands
+
+
+def default_socket():
+    folder = os.getenv('XDG_RUNTIME_DIR') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(folder, 'cfly.sock')
+
+
+def request(path, message):
+    '''
+        Send a build to the server. The message holds the ``python_abi()`` of the client and the build kwargs,
+        they must be JSON serializable and use absolute paths.
+
+        Returns:
+            dict: ``{'path': ..., 'report': ...}`` or ``{'error': ..., 'message': ...}``.
+    '''
+
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(message).encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    return json.loads(b''.join(chunks))
+
+
+def remove_stale_socket(path):
+    '''
+        Remove the socket left at ``path`` by a server that did not shut down.
+
+        Raises:
+            FileExistsError: ``path`` is not a socket or a server is listening on it.
+    '''
+
+    import socket
+
+    try:
+        mode = os.lstat(path).st_mode
+
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError('%s exists and is not a socket' % path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        if not client.connect_ex(path):
+            raise FileExistsError('a server is already listening on %s' % path)
+
+    os.unlink(path)
+
+
+class Server:
+    def __init__(self, jobs=None):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pool = ThreadPoolExecutor(jobs or os.cpu_count() or 1)
+        self.lock = threading.Lock()
+        self.running = {}
+
+    def run(self, steps):
+        results = None
+        while True:
+            try:
+                commands, env = steps.send(results)
+
+            except StopIteration as ex:
+                return ex.value
+
+            results = list(self.pool.map(lambda x: run_commands(x, env), commands))
+
+    def build(self, message):
+        # the module is loaded by the client, it must be built for the same interpreter
+        if message['abi'] != list(python_abi()):
+            raise ValueError('python abi mismatch, the server runs %s' % sys.version)
+
+        kwargs = message['kwargs']
+        if kwargs['macros'] is not None:
+            kwargs['macros'] = [tuple(x) for x in kwargs['macros']]
+
+        reports = []
+        path = self.run(build_steps(**dict(kwargs, report=reports.append, load=False, server='')))
+        return {'path': path, 'report': reports[-1] if reports else None}
+
+    def handle(self, message):
+        from concurrent.futures import Future
+
+        key = json.dumps(message, sort_keys=True)
+
+        with self.lock:
+            future = self.running.get(key)
+            owner = future is None
+            if owner:
+                future = self.running[key] = Future()
+
+        # identical requests wait for the first one
+        if owner:
+            try:
+                future.set_result(self.build(message))
+
+            except Exception as ex:
+                future.set_result({'error': type(ex).__name__, 'message': str(ex)})
+
+            finally:
+                with self.lock:
+                    del self.running[key]
+
+        return future.result()
+
+
+def serve(path=None, jobs=None):
+    '''
+        Serve builds on a Unix socket until interrupted.
+
+        Args:
+            path (str): The socket path. defaults to ``$XDG_RUNTIME_DIR/cfly.sock``.
+            jobs (int): Number of parallel compiler processes for all the clients. defaults to the CPU count.
+
+        Raises:
+            FileExistsError: ``path`` is not a socket or another server is listening on it.
+    '''
+
+    import socketserver
+
+    path = path or default_socket()
+    server = Server(jobs)
+
+    # the builds run here, not in another server
+    os.environ.pop('CFLY_SERVER', None)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            response = server.handle(json.loads(line))
+            self.wfile.write(json.dumps(response).encode())
+
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def server_bind(self):
+            # only the user running the server may connect, the socket is never created with wider permissions
+            umask = os.umask(0o177)
+            try:
+                super().server_bind()
+
+            finally:
+                os.umask(umask)
+
+    remove_stale_socket(path)
+
+    with UnixServer(path, Handler) as listener:
+        try:
+            listener.serve_forever()
+
+        finally:
+            server.pool.shutdown()
+            os.unlink(path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m cfly.server')
+    parser.add_argument('--socket', help='the socket path, defaults to $XDG_RUNTIME_DIR/cfly.sock')
+    parser.add_argument('--jobs', type=int, help='number of parallel compiler processes')
+    args = parser.parse_args()
+
+    try:
+        serve(args.socket, args.jobs)
+
+    except FileExistsError as ex:
+        parser.exit(1, '%s\n' % ex)
+
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+from cfly import build_module
+
+mymodule = build_module('mymodule', '''
+    #include <Python.h>
+
+    PyObject * meth_total(PyObject * self, PyObject * const * args, Py_ssize_t nargs) {
+        long total = 0;
+
+        for (Py_ssize_t i = 0; i < nargs; ++i) {
+            total += PyLong_AsLong(args[i]);
+        }
+
+        if (PyErr_Occurred()) {
+            return 0;
+        }
+
+        return PyLong_FromLong(total);
+    }
+''')
+
+print(mymodule.total(1, 2, 3))
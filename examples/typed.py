@@ -0,0 +1,13 @@
+from cfly import build_module
+
+mymodule = build_module('mymodule', '''
+    #include <Python.h>
+    #include <string>
+
+    std::string meth_mymethod(std::string_view arg_str, int arg_int = 0) {
+        return "String: " + std::string(arg_str) + ", Integer: " + std::to_string(arg_int);
+    }
+''')
+
+print(mymodule.mymethod('Hello World!', 12345))
+print(mymodule.mymethod(arg_str='Hello World!'))
@@ -0,0 +1,19 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TempFolderTestCase(unittest.TestCase):
+    '''
+        Every test builds in its own temporary folder, the shared cache is in that folder too.
+    '''
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.folder = tempdir.name
+
+        environ = mock.patch.dict(os.environ, {'CFLY_CACHE_DIR': os.path.join(self.folder, 'cache')})
+        environ.start()
+        self.addCleanup(environ.stop)
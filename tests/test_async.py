@@ -0,0 +1,46 @@
+import asyncio
+import os
+import unittest
+
+from cfly import build_module_async
+
+from support import TempFolderTestCase
+
+source = '''
+#include <Python.h>
+
+PyObject * meth_answer(PyObject * self) {
+    return PyLong_FromLong(42);
+}
+'''
+
+
+class TestCase(TempFolderTestCase):
+    def build(self, name, **kwargs):
+        build_dir = os.path.join(self.folder, 'build')
+        return build_module_async(name, source, build_dir=build_dir, output_dir=self.folder, **kwargs)
+
+    def test_build_async(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            task = asyncio.ensure_future(ticker())
+            mod = await self.build('test_build_async', shared_cache=False)
+            task.cancel()
+            return mod
+
+        self.assertEqual(asyncio.run(main()).answer(), 42)
+        self.assertGreater(len(ticks), 1)
+
+    def test_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.build('test_timeout', shared_cache=False, pch=False, timeout=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
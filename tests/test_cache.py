@@ -0,0 +1,45 @@
+import os
+import unittest
+
+from cfly import build_module, cache_info, clear_cache, prune_cache
+
+from support import TempFolderTestCase
+
+source = '''
+#include <Python.h>
+
+PyObject * meth_answer(PyObject * self) {
+    return PyLong_FromLong(42);
+}
+'''
+
+
+class TestCase(TempFolderTestCase):
+    def build(self, name, build_dir):
+        build_dir = os.path.join(self.folder, build_dir)
+        return build_module(name, source, build_dir=build_dir, output_dir=build_dir)
+
+    def test_shared_between_modules(self):
+        self.assertEqual(self.build('test_cache_first', 'first').answer(), 42)
+        first = cache_info()
+        # two objects, the module and the precompiled header
+        self.assertEqual(first['entries'], 4)
+
+        self.assertEqual(self.build('test_cache_second', 'second').answer(), 42)
+        self.assertEqual(cache_info()['entries'], 6)
+
+    def test_prune(self):
+        self.build('test_cache_prune', 'prune')
+        self.assertGreater(cache_info()['size'], 0)
+        self.assertEqual(prune_cache(cache_info()['size']), 0)
+        self.assertEqual(prune_cache(1), 4)
+        self.assertEqual(cache_info()['entries'], 0)
+
+    def test_clear(self):
+        self.build('test_cache_clear', 'clear')
+        self.assertEqual(clear_cache(), 4)
+        self.assertEqual(cache_info()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
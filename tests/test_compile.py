@@ -1,12 +1,273 @@
+import os
 import unittest
+from unittest import mock
 
-from cfly import build_module
+from cfly import build_module, build_modules, core, invalidate
 
+from support import TempFolderTestCase
+
+
+def train(mod):
+    for i in range(1000):
+        mod.collatz(i)
+
+
+class TestCase(TempFolderTestCase):
+    def write(self, filename, content):
+        filename = os.path.join(self.folder, filename)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    def build(self, name, source=None, **kwargs):
+        kwargs.setdefault('build_dir', os.path.join(self.folder, 'build'))
+        kwargs.setdefault('output_dir', self.folder)
+        return build_module(name, source, **kwargs)
 
-class TestCase(unittest.TestCase):
     def test_compile(self):
         build_module('mymod')
 
+    def test_parallel_compile(self):
+        preprocess = [
+            self.write('part%d.cpp' % i, '#include <Python.h>\nPyObject * meth_part%d(PyObject * self) {\n'
+                       '    return PyLong_FromLong(%d);\n}\n' % (i, i))
+            for i in range(4)
+        ]
+        mod = self.build('test_parallel_compile', preprocess=preprocess, jobs=4)
+        self.assertEqual([mod.part0(), mod.part1(), mod.part2(), mod.part3()], [0, 1, 2, 3])
+
+    def test_unity(self):
+        self.write('value.hpp', '#define VALUE 7\n')
+        sources = [
+            self.write('helper.cpp', 'long helper(long x) {\n    return x * 2;\n}\n'),
+            # valid C that is not valid C++
+            self.write('offset.c', '#include <stdlib.h>\nlong offset(void) {\n    int * new = malloc(sizeof(int));\n'
+                       '    *new = 1;\n    long result = *new;\n    free(new);\n    return result;\n}\n'),
+        ]
+        preprocess = [
+            self.write('unity%d.cpp' % i, '#include <Python.h>\n#include "value.hpp"\nlong helper(long x);\n'
+                       'extern "C" long offset(void);\nPyObject * meth_unity%d(PyObject * self) {\n'
+                       '    return PyLong_FromLong(helper(VALUE + %d) + offset());\n}\n' % (i, i))
+            for i in range(3)
+        ]
+
+        mod = self.build('test_unity', sources=sources, preprocess=preprocess, unity=True, shared_cache=False)
+        self.assertEqual([mod.unity0(), mod.unity1(), mod.unity2()], [15, 17, 19])
+        self.assertEqual(len(self.objects()), 1 + 1)
+
+        mod = self.build('test_unity_batches', sources=sources, preprocess=preprocess, unity=2, shared_cache=False)
+        self.assertEqual(mod.unity2(), 19)
+        # the object of the C source is reused
+        self.assertEqual(len(self.objects()), 1 + 1 + 3)
+
+        with self.assertRaisesRegex(ValueError, 'invalid unity'):
+            self.build('test_unity_invalid', sources=sources, unity=0)
+
+    def test_compile_error(self):
+        with self.assertRaisesRegex(Exception, 'Compiler failed'):
+            self.build('test_compile_error', '#include <Python.h>\nint x = ;\n', jobs=2)
+
+    def test_error_location(self):
+        preprocess = [self.write('error_location.cpp', '#include <Python.h>\n\nint x = ;\n')]
+        with self.assertRaisesRegex(Exception, '%s:3:' % preprocess[0]):
+            self.build('test_error_location', preprocess=preprocess)
+
+    def test_header_dependency(self):
+        self.write('value.hpp', '#define VALUE 1\n')
+        self.write('other.cpp', 'int other = 0;\n')
+        sources = [os.path.join(self.folder, 'other.cpp')]
+        preprocess = [self.write('module.cpp', '#include <Python.h>\n#include "value.hpp"\n'
+                                 'PyObject * meth_value(PyObject * self) {\n    return PyLong_FromLong(VALUE);\n}\n')]
+
+        mod = self.build('test_header_dependency', sources=sources, preprocess=preprocess, shared_cache=False)
+        self.assertEqual(mod.value(), 1)
+        objects = {x: os.path.getmtime(x) for x in self.objects()}
+        self.assertEqual(len(objects), 3)
+
+        self.write('value.hpp', '#define VALUE 2\n')
+        future = max(objects.values()) + 10
+        os.utime(os.path.join(self.folder, 'value.hpp'), (future, future))
+
+        mod = self.build(
+            'test_header_dependency', sources=sources, preprocess=preprocess, output='reloaded.so', shared_cache=False)
+        self.assertEqual(mod.value(), 2)
+        rebuilt = [x for x in objects if os.path.getmtime(x) != objects[x]]
+        self.assertEqual(len(rebuilt), 1)
+
+    def test_registry(self):
+        source = '#include <Python.h>\nPyObject * meth_hello(PyObject * self) {\n    Py_RETURN_NONE;\n}\n'
+        mod = self.build('test_registry', source)
+        self.assertIs(self.build('test_registry', source), mod)
+
+        os.unlink(mod.__file__)
+        self.assertIs(self.build('test_registry', source), mod)
+
+        invalidate('test_registry')
+        self.assertTrue(os.path.isfile(self.build('test_registry', source).__file__))
+
+    def test_cross_device_output(self):
+        import errno
+
+        replace = os.replace
+
+        def cross_device(src, dst):
+            if os.path.dirname(os.path.abspath(src)) != os.path.dirname(os.path.abspath(dst)):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            replace(src, dst)
+
+        source = '#include <Python.h>\nPyObject * meth_hello(PyObject * self) {\n    return PyLong_FromLong(5);\n}\n'
+        with mock.patch('os.replace', side_effect=cross_device):
+            mod = self.build('test_cross_device', source, output_dir=os.path.join(self.folder, 'out'))
+
+        self.assertEqual(mod.hello(), 5)
+        self.assertEqual(os.listdir(os.path.dirname(mod.__file__)), [os.path.basename(mod.__file__)])
+
+    def test_precompiled_header(self):
+        source = '#define PY_SSIZE_T_CLEAN\n#include <Python.h>\n' \
+            'PyObject * meth_size(PyObject * self, PyObject * args) {\n    const char * data;\n    Py_ssize_t size;\n' \
+            '    if (!PyArg_ParseTuple(args, "s#", &data, &size)) {\n        return 0;\n    }\n' \
+            '    return PyLong_FromSsize_t(size);\n}\n'
+        mod = self.build('test_precompiled_header', source, shared_cache=False)
+        self.assertEqual(mod.size('abc'), 3)
+        headers = [x for root, dirs, files in os.walk(self.folder) for x in files if x.endswith('.gch')]
+        self.assertEqual(headers, ['cfly.hpp.gch'])
+
+        mod = self.build('test_precompiled_header_disabled', source, shared_cache=False, pch=False)
+        self.assertEqual(mod.size('abcd'), 4)
+
+    def test_c_sources(self):
+        sources = [self.write('helper.c', 'int helper(void) {\n    return 3;\n}\n')]
+        preprocess = [self.write('c_sources.cpp', '#include <Python.h>\nextern "C" int helper(void);\n'
+                                 'PyObject * meth_helper(PyObject * self) {\n'
+                                 '    return PyLong_FromLong(helper());\n}\n')]
+
+        mod = self.build('test_c_sources', sources=sources, preprocess=preprocess)
+        self.assertEqual(mod.helper(), 3)
+
+    def test_build_modules(self):
+        build_dir = os.path.join(self.folder, 'build')
+        specs = [
+            {
+                'name': 'test_build_modules_%d' % i,
+                'source': '#include <Python.h>\nPyObject * meth_index(PyObject * self) {\n'
+                          '    return PyLong_FromLong(%d);\n}\n' % i,
+                'build_dir': build_dir,
+                'output_dir': self.folder,
+            }
+            for i in range(3)
+        ]
+        specs.append({'name': 'test_build_modules_error', 'source': 'int x = ;\n', 'build_dir': build_dir})
+
+        modules = build_modules(specs, jobs=4)
+        self.assertEqual([modules['test_build_modules_%d' % i].index() for i in range(3)], [0, 1, 2])
+        self.assertIsInstance(modules['test_build_modules_error'], Exception)
+
+    def test_report(self):
+        import json
+
+        reports = []
+        source = '#include <Python.h>\nPyObject * meth_hello(PyObject * self) {\n    return PyLong_FromLong(1);\n}\n'
+
+        self.build('test_report', source, shared_cache=False, report=reports.append)
+        self.build('test_report', source, shared_cache=False, report=reports.append)
+        invalidate()
+        self.build('test_report', source, shared_cache=False, report=reports.append)
+        invalidate()
+        self.build('test_report', source, shared_cache=False, pch=False, report=reports.append)
+
+        self.assertEqual([x['result'] for x in reports], ['built', 'registry', 'up_to_date', 'built'])
+        self.assertEqual([x['reason'] for x in reports], ['first build', None, None, 'arguments changed'])
+        self.assertLessEqual({'parse', 'render', 'compile', 'link', 'load'}, set(reports[0]['phases']))
+        self.assertEqual([x['cache'] for x in reports[0]['objects']], ['disabled', 'disabled'])
+        self.assertTrue(all(x['seconds'] > 0 for x in reports[0]['objects']))
+
+        with open(os.path.join(self.folder, 'build', 'temp', 'test_report', 'report.json')) as f:
+            self.assertEqual(json.load(f)['reason'], 'arguments changed')
+
+    def test_compiler_config(self):
+        with mock.patch.object(core, 'compiler_configs', {}):
+            compiler = core.create_compiler(self.folder)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.folder, 'compiler.txt')))
+
+        with mock.patch.object(core, 'compiler_configs', {}), \
+                mock.patch.object(core, 'discover_compiler', side_effect=AssertionError):
+            cached = core.create_compiler(self.folder)
+
+        self.assertEqual(cached.compiler_type, compiler.compiler_type)
+        self.assertEqual(cached.include_dirs, compiler.include_dirs)
+        self.assertEqual(getattr(cached, 'compiler_so', None), getattr(compiler, 'compiler_so', None))
+
+        with mock.patch.object(core, 'compiler_configs', {}), mock.patch.dict(os.environ, {'CFLAGS': '-O1'}):
+            self.assertIn('-O1', ' '.join(getattr(core.create_compiler(self.folder), 'compiler_so', ['-O1'])))
+
+        # a file missing keys is rediscovered
+        for content in ("{'fingerprint': 'x'}", "['fingerprint']", '{}'):
+            self.write('compiler.txt', content)
+            with mock.patch.object(core, 'compiler_configs', {}):
+                self.assertEqual(core.create_compiler(self.folder).compiler_type, compiler.compiler_type)
+
+    def test_single_flight(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        source = '#include <Python.h>\nPyObject * meth_hello(PyObject * self) {\n    return PyLong_FromLong(7);\n}\n'
+
+        def build(index):
+            return self.build('test_single_flight', source, shared_cache=False)
+
+        with mock.patch.object(core, 'create_compiler', wraps=core.create_compiler) as create_compiler:
+            with ThreadPoolExecutor(4) as pool:
+                modules = list(pool.map(build, range(4)))
+
+        self.assertEqual(create_compiler.call_count, 1)
+        self.assertEqual([mod.hello() for mod in modules], [7, 7, 7, 7])
+        self.assertEqual([x for x in os.listdir(self.folder) if x.startswith('test_single_flight')], [
+            os.path.basename(modules[0].__file__),
+        ])
+
+    def test_opt(self):
+        source = '#include <Python.h>\nPyObject * meth_optimized(PyObject * self) {\n' \
+            '#ifdef __OPTIMIZE__\n    Py_RETURN_TRUE;\n#else\n    Py_RETURN_FALSE;\n#endif\n}\n'
+
+        self.assertFalse(self.build('test_opt_debug', source, opt='debug').optimized())
+        self.assertTrue(self.build('test_opt_lto', source, opt='lto').optimized())
+
+        with self.assertRaisesRegex(ValueError, 'invalid opt'):
+            self.build('test_opt_invalid', source, opt='fast')
+
+    def test_pgo(self):
+        if not core.is_gcc(core.create_compiler(os.path.join(self.folder, 'build'))):
+            self.skipTest('pgo requires gcc')
+
+        source = '#include <Python.h>\nlong meth_collatz(PyObject * self, long n) {\n    long steps = 0;\n' \
+            '    while (n > 1) {\n        n = n % 2 ? n * 3 + 1 : n / 2;\n        steps += 1;\n    }\n' \
+            '    return steps;\n}\n'
+
+        self.assertEqual(self.build('test_pgo', source, pgo=train).collatz(27), 111)
+
+        profiles = os.path.join(self.folder, 'build', 'pgo', 'profiles')
+        [digest] = os.listdir(profiles)
+        self.assertTrue([x for x in os.listdir(os.path.join(profiles, digest)) if x.endswith('.gcda')])
+
+        # the profile is reused while the instrumented module and the training are the same
+        invalidate()
+        with mock.patch('multiprocessing.get_context', side_effect=AssertionError):
+            self.assertEqual(self.build('test_pgo', source, pgo=train).collatz(27), 111)
+
+    def test_training_id(self):
+        stamp = core.training_id(train)
+        self.assertEqual(core.training_id(train), stamp)
+
+        code = train.__code__
+        train.__code__ = (lambda mod: mod.collatz(27)).__code__
+        try:
+            self.assertNotEqual(core.training_id(train), stamp)
+        finally:
+            train.__code__ = code
+
+    def objects(self):
+        return [os.path.join(root, x) for root, dirs, files in os.walk(self.folder) for x in files if x.endswith('.o')]
+
 
 if __name__ == '__main__':
     unittest.main()
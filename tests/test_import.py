@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from cfly import build_module
+
+heavy_modules = ['distutils', 'jinja2', 'subprocess', 'concurrent.futures']
+
+check = '''
+import sys
+import cfly
+%s
+print(' '.join(x for x in %r if x in sys.modules))
+'''
+
+# the patterns compiled while cfly is imported, the scanner patterns are thousands of characters long
+compiled = '''
+import re
+compile = re.compile
+lengths = []
+re.compile = lambda pattern, *args: lengths.append(len(pattern)) or compile(pattern, *args)
+import cfly
+print(max(lengths, default=0))
+'''
+
+
+class TestCase(unittest.TestCase):
+    def python(self, script):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        return subprocess.check_output([sys.executable, '-c', script], env=env).decode()
+
+    def run_python(self, code):
+        return self.python(check % (code, heavy_modules)).split()
+
+    def test_import(self):
+        self.assertEqual(self.run_python(''), [])
+
+    def test_import_compiles_no_scanner_patterns(self):
+        self.assertLess(int(self.python(compiled)), 1000)
+
+    def test_load_cached_module(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with mock.patch.dict(os.environ, {'CFLY_CACHE_DIR': os.path.join(folder, 'cache')}):
+                kwargs = {'build_dir': os.path.join(folder, 'build'), 'output_dir': folder}
+                build_module('test_load_cached_module', '#include <Python.h>\n', **kwargs)
+                code = 'cfly.build_module(%r, %r, **%r)' % ('test_load_cached_module', '#include <Python.h>\n', kwargs)
+                self.assertEqual(self.run_python(code), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
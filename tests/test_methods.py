@@ -0,0 +1,369 @@
+import os
+import sys
+import unittest
+
+from cfly import build_module
+
+from support import TempFolderTestCase
+
+
+class TestCase(TempFolderTestCase):
+    def build(self, name, source=None, **kwargs):
+        kwargs.setdefault('build_dir', os.path.join(self.folder, 'build'))
+        kwargs.setdefault('output_dir', self.folder)
+        return build_module(name, source, **kwargs)
+
+    def test_fastcall(self):
+        mod = self.build('test_fastcall', '''
+            #include <Python.h>
+
+            struct Counter {
+                PyObject_HEAD
+            };
+
+            PyObject * Counter_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+                return type->tp_alloc(type, 0);
+            }
+
+            PyObject * Counter_meth_count(Counter * self, PyObject * const * args, Py_ssize_t nargs) {
+                return PyLong_FromSsize_t(nargs);
+            }
+
+            PyObject * meth_count(PyObject * self, PyObject * const * args, Py_ssize_t nargs) {
+                return PyLong_FromSsize_t(nargs);
+            }
+
+            PyObject * meth_keywords(PyObject * self, PyObject *const *args, Py_ssize_t nargs, PyObject * kwnames) {
+                return Py_BuildValue("nn", nargs, kwnames ? PyTuple_GET_SIZE(kwnames) : 0);
+            }
+        ''')
+
+        self.assertEqual(mod.count(1, 2, 3), 3)
+        self.assertEqual(mod.keywords(1, a=2, b=3), (1, 2))
+        self.assertEqual(mod.Counter().count(1, 2), 2)
+
+    def test_vectorcall(self):
+        mod = self.build('test_vectorcall', '''
+            #include <Python.h>
+
+            struct Adder {
+                PyObject_HEAD
+                vectorcallfunc vectorcall;
+                long value;
+            };
+
+            PyObject * Adder_call(PyObject * self, PyObject * const * args, size_t nargsf, PyObject * kwnames) {
+                return PyLong_FromLong(((Adder *)self)->value + PyVectorcall_NARGS(nargsf));
+            }
+
+            PyObject * Adder_tp_vectorcall(
+                    PyObject * type, PyObject * const * args, size_t nargsf, PyObject * kwnames) {
+                Adder * self = PyObject_New(Adder, (PyTypeObject *)type);
+                self->vectorcall = Adder_call;
+                self->value = PyVectorcall_NARGS(nargsf) ? PyLong_AsLong(args[0]) : 0;
+                return (PyObject *)self;
+            }
+
+            void Adder_tp_dealloc(Adder * self) {
+                PyObject_Del(self);
+            }
+        ''')
+
+        adder = mod.Adder(10)
+        self.assertEqual(adder(), 10)
+        self.assertEqual(adder(1, 2, 3), 13)
+
+    def test_typed(self):
+        mod = self.build('test_typed', '''
+            #include <Python.h>
+            #include <string>
+
+            struct Greeter {
+                PyObject_HEAD
+                long count;
+            };
+
+            PyObject * Greeter_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+                return type->tp_alloc(type, 0);
+            }
+
+            std::string Greeter_meth_greet(Greeter * self, std::string_view name, bool shout = false) {
+                self->count += 1;
+                std::string result = "Hello " + std::string(name);
+                return shout ? result + "!" : result;
+            }
+
+            long Greeter_meth_count(Greeter * self) {
+                return self->count;
+            }
+
+            double meth_add(long a, double b = 0.5) {
+                return a + b;
+            }
+
+            Py_ssize_t meth_size(Py_buffer view) {
+                return view.len;
+            }
+
+            void meth_nothing() {
+            }
+        ''')
+
+        self.assertEqual(mod.add(1, 2.0), 3.0)
+        self.assertEqual(mod.add(b=1.5, a=1), 2.5)
+        self.assertEqual(mod.add(1), 1.5)
+        self.assertEqual(mod.size(b'abcd'), 4)
+        self.assertIsNone(mod.nothing())
+
+        greeter = mod.Greeter()
+        self.assertEqual(greeter.greet('cfly'), 'Hello cfly')
+        self.assertEqual(greeter.greet('cfly', shout=True), 'Hello cfly!')
+        self.assertEqual(greeter.count(), 2)
+
+        with self.assertRaisesRegex(TypeError, 'missing required argument'):
+            mod.add()
+
+        with self.assertRaisesRegex(TypeError, 'unexpected keyword'):
+            mod.add(1, c=2)
+
+        with self.assertRaises(TypeError):
+            mod.add('x')
+
+        with self.assertRaises(TypeError):
+            mod.nothing(1)
+
+    def test_buffer(self):
+        import array
+        import ctypes
+
+        mod = self.build('test_buffer', '''
+            #include <Python.h>
+
+            double meth_total(cfly::buffer<const double> values) {
+                double total = 0.0;
+                for (double x : values) {
+                    total += x;
+                }
+                return total;
+            }
+
+            Py_ssize_t meth_rows(cfly::buffer<const double, 2> matrix) {
+                return matrix.shape[0];
+            }
+
+            void meth_fill(cfly::buffer<unsigned char> data, int value) {
+                for (unsigned char & x : data) {
+                    x = value;
+                }
+            }
+        ''')
+
+        values = array.array('d', [1.0, 2.0, 3.5])
+        self.assertEqual(mod.total(values), 6.5)
+        self.assertEqual(mod.total(memoryview(values)), 6.5)
+        self.assertEqual(mod.rows(memoryview(bytes(48)).cast('d', (2, 3))), 2)
+
+        data = bytearray(4)
+        mod.fill(data, 7)
+        self.assertEqual(data, bytearray([7, 7, 7, 7]))
+
+        with self.assertRaisesRegex(TypeError, 'floating point'):
+            mod.total(array.array('q', [1, 2]))
+
+        native = (ctypes.c_double * 2)(1.0, 2.0)
+        self.assertEqual(mod.total(native), 3.0)
+
+        swapped = ctypes.c_double.__ctype_be__ if sys.byteorder == 'little' else ctypes.c_double.__ctype_le__
+        with self.assertRaisesRegex(TypeError, 'floating point'):
+            mod.total((swapped * 2)(1.0, 2.0))
+
+        with self.assertRaisesRegex(ValueError, '2-dimensional'):
+            mod.rows(values)
+
+        with self.assertRaises(BufferError):
+            mod.total(memoryview(values)[::2])
+
+        with self.assertRaises(BufferError):
+            mod.fill(b'abcd', 7)
+
+    def test_memoryview(self):
+        mod = self.build('test_memoryview', '''
+            #include <Python.h>
+            #include <stdlib.h>
+            #include <vector>
+
+            int released = 0;
+
+            std::vector<double> meth_squares(int count) {
+                std::vector<double> result(count);
+                for (int i = 0; i < count; ++i) {
+                    result[i] = i * i;
+                }
+                return result;
+            }
+
+            PyObject * meth_mapped(PyObject * self) {
+                int * data = (int *)malloc(3 * sizeof(int));
+                data[0] = 1;
+                data[1] = 2;
+                data[2] = 3;
+                return cfly::memoryview((const int *)data, 3, [data]() {
+                    free(data);
+                    released += 1;
+                });
+            }
+
+            int meth_released() {
+                return released;
+            }
+        ''')
+
+        squares = mod.squares(4)
+        self.assertIsInstance(squares, memoryview)
+        self.assertEqual((squares.format, squares.readonly), ('d', False))
+        self.assertEqual(squares.tolist(), [0.0, 1.0, 4.0, 9.0])
+
+        mapped = mod.mapped()
+        self.assertEqual((mapped.format, mapped.readonly, mapped.tolist()), ('i', True, [1, 2, 3]))
+        copy = memoryview(mapped)
+        del mapped
+        self.assertEqual(mod.released(), 0)
+        del copy
+        self.assertEqual(mod.released(), 1)
+
+    def test_memoryview_items(self):
+        from distutils.errors import CompileError
+
+        with self.assertRaisesRegex(CompileError, 'trivially copyable'):
+            self.build('test_memoryview_strings', '''
+                #include <Python.h>
+                #include <string>
+                #include <vector>
+
+                std::vector<std::string> meth_names() {
+                    return std::vector<std::string>(2, "name");
+                }
+            ''')
+
+        with self.assertRaisesRegex(CompileError, 'std::move'):
+            self.build('test_memoryview_lvalue', '''
+                #include <Python.h>
+                #include <vector>
+
+                std::vector<int> values(3);
+
+                PyObject * meth_values(PyObject * self) {
+                    return cfly::memoryview(values);
+                }
+            ''')
+
+    def test_nogil(self):
+        mod = self.build('test_nogil', '''
+            #include <Python.h>
+
+            CFLY_NOGIL int meth_released(double value) {
+                return !PyGILState_Check();
+            }
+
+            CFLY_NOGIL void meth_nothing() {
+            }
+
+            int meth_held() {
+                return PyGILState_Check();
+            }
+        ''')
+
+        self.assertEqual(mod.released(1.0), 1)
+        self.assertEqual(mod.held(), 1)
+        self.assertIsNone(mod.nothing())
+
+    def test_freelist(self):
+        mod = self.build('test_freelist', '''
+            #include <Python.h>
+
+            struct Point {
+                PyObject_HEAD
+                CFLY_FREELIST(4)
+                double x;
+            };
+
+            PyObject * Point_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+                Point * self = (Point *)type->tp_alloc(type, 0);
+                if (self && !PyArg_ParseTuple(args, "d", &self->x)) {
+                    Py_DECREF(self);
+                    return 0;
+                }
+                return (PyObject *)self;
+            }
+
+            double Point_meth_x(Point * self) {
+                return self->x;
+            }
+        ''')
+
+        points = [mod.Point(i) for i in range(6)]
+        del points
+        self.assertEqual(mod.__cfly_freelists__()['Point'], {'size': 4, 'count': 4, 'hits': 0, 'misses': 6})
+
+        point = mod.Point(1.5)
+        self.assertEqual(point.x(), 1.5)
+        self.assertEqual(mod.__cfly_freelists__()['Point'], {'size': 4, 'count': 3, 'hits': 1, 'misses': 6})
+
+    def test_profile(self):
+        mod = self.build('test_profile', '''
+            #include <Python.h>
+
+            struct Point {
+                PyObject_HEAD
+                double x;
+            };
+
+            PyObject * Point_tp_new(PyTypeObject * type, PyObject * args, PyObject * kwargs) {
+                return type->tp_alloc(type, 0);
+            }
+
+            PyObject * Point_tp_repr(Point * self) {
+                return PyUnicode_FromString("Point");
+            }
+
+            PyObject * Point_get_x(Point * self, void * closure) {
+                return PyFloat_FromDouble(self->x);
+            }
+
+            double Point_meth_scale(Point * self, double factor) {
+                return self->x * factor;
+            }
+
+            PyObject * meth_hello(PyObject * self) {
+                return PyLong_FromLong(1);
+            }
+
+            long meth_add(PyObject * self, long a, long b) {
+                return a + b;
+            }
+        ''', profile=True)
+
+        point = mod.Point()
+        for i in range(3):
+            mod.hello()
+            mod.add(i, 1)
+            point.scale(2.0)
+            point.x
+            repr(point)
+
+        stats = mod.__cfly_stats__(reset=True)
+        self.assertEqual({name: value['calls'] for name, value in stats.items()}, {
+            'hello': 3,
+            'add': 3,
+            'Point.scale': 3,
+            'Point.get_x': 3,
+            'Point.tp_new': 1,
+            'Point.tp_repr': 3,
+        })
+        self.assertGreater(stats['add']['ns'], 0)
+        self.assertEqual(mod.__cfly_stats__()['add'], {'calls': 0, 'ns': 0})
+        self.assertFalse(hasattr(self.build('test_profile_disabled', 'int x;\n'), '__cfly_stats__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
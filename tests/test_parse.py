@@ -0,0 +1,135 @@
+import io
+import time
+import unittest
+
+from cfly import core, scanner
+
+source = '''\
+#include <Python.h>
+#define BRACE {
+
+struct Point {
+    PyObject_HEAD
+    struct {
+        union {
+            struct {
+                struct {
+                    double x;
+                } inner;
+            } a;
+        } b;
+    } c;
+};
+
+// PyObject * meth_commented(PyObject * self) {
+/* PyObject * meth_commented(PyObject * self) { */
+
+const char * text = "PyObject * meth_quoted(PyObject * self) {";
+
+PyObject * Point_meth_norm(Point * self) {
+    if (self) {
+        const char * brace = "}";
+        char c = '}';
+    }
+    Py_RETURN_NONE;
+}
+
+PyObject * Point_get_x(Point * self, void * closure) {
+    return PyFloat_FromDouble(self->c.b.a.inner.x);
+}
+
+void Point_tp_dealloc(Point * self) {
+    Py_TYPE(self)->tp_free(self);
+}
+
+PyObject * meth_add(PyObject * self, PyObject * args, PyObject * kwargs) {
+    Py_RETURN_NONE;
+}
+'''
+
+
+class TestCase(unittest.TestCase):
+    def test_scan(self):
+        types, procs = scanner.scan(source)
+        self.assertEqual([name for name, struct in types], ['Point'])
+        self.assertTrue(types[0][1].startswith('\n    PyObject_HEAD\n'))
+        self.assertEqual(procs, [
+            ('PyObject *', 'Point', 'meth_norm', 'Point * self'),
+            ('PyObject *', 'Point', 'get_x', 'Point * self, void * closure'),
+            ('void', 'Point', 'tp_dealloc', 'Point * self'),
+            ('PyObject *', 'meth', 'add', 'PyObject * self, PyObject * args, PyObject * kwargs'),
+        ])
+
+    def test_parse_source(self):
+        methods, types = core.parse_source(source, io.BytesIO())
+        self.assertEqual(list(methods), ['add'])
+        self.assertEqual(methods['add'].flags, 'METH_VARARGS | METH_KEYWORDS')
+        self.assertEqual(list(types['Point'].methods), ['norm'])
+        self.assertEqual(types['Point'].getset['x'].get, 'Point_get_x')
+        self.assertEqual(types['Point'].tp_dealloc, 'Point_tp_dealloc')
+
+    def test_extern_c(self):
+        types, procs = scanner.scan('''
+            extern "C" {
+            struct Point {
+                PyObject_HEAD
+            };
+
+            PyObject * meth_inside(PyObject * self) {
+                Py_RETURN_NONE;
+            }
+            }
+
+            extern "C" PyObject * meth_prefixed(PyObject * self) {
+                Py_RETURN_NONE;
+            }
+
+            namespace detail {
+            PyObject * meth_hidden(PyObject * self) {
+                Py_RETURN_NONE;
+            }
+            }
+
+            PyObject * meth_after(PyObject * self) {
+                Py_RETURN_NONE;
+            }
+        ''')
+        self.assertEqual([name for name, struct in types], ['Point'])
+        self.assertEqual([name for rval, typ, name, args in procs], ['inside', 'prefixed', 'after'])
+
+    def test_nested_bodies(self):
+        types, procs = scanner.scan('''
+            PyObject * meth_deep(PyObject * self) {
+                { { { { const char * text = R"(}})"; } } } }
+                Py_RETURN_NONE;
+            }
+
+            PyObject * meth_next(PyObject * self) {
+                Py_RETURN_NONE;
+            }
+        ''')
+        self.assertEqual([name for rval, typ, name, args in procs], ['deep', 'next'])
+
+    def test_linear_time(self):
+        sources = [
+            'int counter' + ' /* doc */' * 1000 + ';',
+            'const /* c */ ' * 1000 + 'x;',
+            'x' + '\n// comment' * 5000 + '\n;',
+            'unsigned ' * 10000,
+        ]
+
+        for source in sources:
+            start = time.perf_counter()
+            self.assertEqual(scanner.scan(source), ([], []))
+            self.assertLess(time.perf_counter() - start, 1.0)
+
+        # the qualifiers are still part of the return type
+        types, procs = scanner.scan('unsigned /* a */ long /* b */ Point_meth_x(Point * self) {\n}\n')
+        self.assertEqual(procs, [('unsigned /* a */ long', 'Point', 'meth_x', 'Point * self')])
+
+    def test_unterminated(self):
+        self.assertEqual(scanner.scan('struct Point {\n    PyObject_HEAD\n    /* int x; "\n'), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from cfly import build_module
+from cfly.server import request
+
+from support import TempFolderTestCase
+
+source = '''
+#include <Python.h>
+
+PyObject * meth_answer(PyObject * self) {
+    return PyLong_FromLong(42);
+}
+'''
+
+
+@unittest.skipIf(sys.platform == 'win32', 'unix sockets')
+class TestCase(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.socket = os.path.join(self.folder, 'cfly.sock')
+        self.start_server()
+
+    def start_server(self):
+        self.server = subprocess.Popen([sys.executable, '-m', 'cfly.server', '--socket', self.socket, '--jobs', '2'])
+
+        # the socket file exists before the server listens
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                if not client.connect_ex(self.socket):
+                    break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.send_signal(signal.SIGINT)
+        self.server.wait(30)
+
+    def build(self, name, source, **kwargs):
+        build_dir = os.path.join(self.folder, 'build')
+        return build_module(name, source, build_dir=build_dir, output_dir=self.folder, server=self.socket, **kwargs)
+
+    def test_server(self):
+        reports = []
+        mod = self.build('test_server', source, report=reports.append)
+        self.assertEqual(mod.answer(), 42)
+        self.assertEqual(reports[0]['result'], 'built')
+        self.assertEqual(reports[0]['output'], mod.__file__)
+
+    def test_concurrent_requests(self):
+        with ThreadPoolExecutor(4) as pool:
+            modules = list(pool.map(lambda i: self.build('test_server_concurrent', source), range(4)))
+
+        self.assertEqual({mod.__file__ for mod in modules}, {modules[0].__file__})
+        self.assertEqual(modules[0].answer(), 42)
+
+    def test_macros(self):
+        code = '#include <Python.h>\nPyObject * meth_value(PyObject * self) {\n    return PyLong_FromLong(VALUE);\n}\n'
+        mod = self.build('test_server_macros', code, macros=[('VALUE', '5')])
+        self.assertEqual(mod.value(), 5)
+
+    def test_abi_mismatch(self):
+        response = request(self.socket, {'abi': ['other', '.so', '0.0'], 'kwargs': {}})
+        self.assertEqual(response['error'], 'ValueError')
+
+    def test_error_type(self):
+        with self.assertRaises(TypeError):
+            self.build('test_server_type_error', source, libraries=[1])
+
+    def test_socket_mode(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket).st_mode), 0o600)
+
+    def test_socket_in_use(self):
+        command = [sys.executable, '-m', 'cfly.server', '--socket', self.socket]
+        result = subprocess.run(command, stderr=subprocess.PIPE, timeout=30)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b'already listening', result.stderr)
+        self.assertEqual(self.build('test_server_in_use', source).answer(), 42)
+
+    def test_not_a_socket(self):
+        path = os.path.join(self.folder, 'notes.txt')
+        with open(path, 'w') as f:
+            f.write('notes')
+
+        command = [sys.executable, '-m', 'cfly.server', '--socket', path]
+        result = subprocess.run(command, stderr=subprocess.PIPE, timeout=30)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b'not a socket', result.stderr)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'notes')
+
+    def test_stale_socket(self):
+        self.server.kill()
+        self.server.wait(30)
+        self.assertTrue(stat.S_ISSOCK(os.lstat(self.socket).st_mode))
+        self.start_server()
+        self.assertEqual(self.build('test_server_stale', source).answer(), 42)
+
+    def test_compile_error(self):
+        with self.assertRaisesRegex(Exception, 'Compiler failed'):
+            self.build('test_server_error', '#include <Python.h>\nint x = ;\n')
+
+
+if __name__ == '__main__':
+    unittest.main()